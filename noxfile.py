@@ -45,7 +45,7 @@ def install_with_constraints(session: Session, *args: str, **kwargs: Any) -> Non
 def tests(session: Session) -> None:
     """Run the test suite."""
     args = session.posargs or ["--cov"]
-    session.run("poetry", "install", "--no-dev", external=True)
+    session.run("poetry", "install", "--no-dev", "--extras", "arrow", external=True)
     install_with_constraints(session, "coverage[toml]", "pytest", "pytest-cov", "mock")
     session.run("pytest", *args)
 
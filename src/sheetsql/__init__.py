@@ -6,6 +6,7 @@ except ImportError:  # pragma: no cover
 from typing import Any
 
 from .connection import GoogleSheetsConnection
+from .query import col  # noqa: F401
 
 try:
     __version__ = version(__name__)
@@ -14,5 +15,8 @@ except PackageNotFoundError:
 
 
 def connect(auth_type: str, **kwargs: Any) -> GoogleSheetsConnection:
-    """Connect to Google Sheets via gspread oauth or service_account."""
+    """Connect to Google Sheets via gspread oauth or service_account.
+
+    Pass ``credentials``, a list of service account files, to pool their quotas.
+    """
     return GoogleSheetsConnection(auth_type, **kwargs)
@@ -1,17 +1,36 @@
 """Class to connect to Google Sheets."""
 
-from typing import Any
+import re
+from typing import Any, Dict, List, Optional
 
 import gspread
+from gspread import Client
 from gspread.exceptions import GSpreadException
+from gspread.utils import extract_id_from_url
 
+from .exceptions import DuplicateSpreadsheetException, SpreadsheetNotFoundException
+from .pool import ClientPool
 from .spreadsheet import Spreadsheet
+from .worksheet import Worksheet
+
+GID_REGEX = re.compile(r"[#&?]gid=(\d+)")
 
 
 class GoogleSheetsConnection:
-    """Wrapper around the gspread package for interracting with Google Sheets."""
+    """Wrapper around the gspread package for interracting with Google Sheets.
+
+    Pass several service account files as ``credentials`` to spread requests across
+    their quotas. Each spreadsheet is then routed, by the ``strategy`` of a
+    ClientPool, only to the credentials that have access to it.
+    """
 
-    def __init__(self, auth_type: str = "service_account", **kwargs: Any) -> None:
+    def __init__(
+        self,
+        auth_type: str = "service_account",
+        credentials: Optional[List[str]] = None,
+        strategy: str = "round_robin",
+        **kwargs: Any,
+    ) -> None:
         """Init method for the GoogleSheetsConnection class."""
         auth = {"oauth": gspread.oauth, "service_account": gspread.service_account}
 
@@ -20,11 +39,60 @@ class GoogleSheetsConnection:
                 f"{auth_type} is not a supported authentication type "
                 f"(supported types are: {auth.keys()}"
             )
-        self._gc = auth[auth_type](**kwargs)
-        self._spreadsheets = {
-            spreadsheet["id"]: Spreadsheet(self._gc, {"id": spreadsheet["id"]})
-            for spreadsheet in self._gc.list_spreadsheet_files()
-        }
+        if credentials is None:
+            self._gc = auth[auth_type](**kwargs)
+        elif auth_type != "service_account":
+            raise GSpreadException(
+                "Multiple credentials are only supported for service accounts"
+            )
+        else:
+            self._gc = ClientPool(
+                [
+                    gspread.service_account(filename=filename, **kwargs)
+                    for filename in credentials
+                ],
+                strategy=strategy,
+                names=list(credentials),
+            )
+        self._spreadsheets: dict = {}
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Relist the spreadsheets the authorized user has access to.
+
+        Spreadsheets that are still listed keep their Spreadsheet instance, with the
+        title from the listing, new ones are opened, and the title index is rebuilt
+        from the listing. Call ``Spreadsheet.refresh`` to refetch the rest of the
+        metadata of a spreadsheet.
+        """
+        spreadsheet_files = self._gc.list_spreadsheet_files()
+        spreadsheets = {}
+        for spreadsheet_file in spreadsheet_files:
+            spreadsheet = self._spreadsheets.get(spreadsheet_file["id"])
+            if spreadsheet is None:
+                spreadsheet = Spreadsheet(
+                    self._client_for(spreadsheet_file["id"]),
+                    {"id": spreadsheet_file["id"], "title": spreadsheet_file["name"]},
+                )
+            else:
+                spreadsheet._properties["title"] = spreadsheet_file["name"]
+            spreadsheets[spreadsheet_file["id"]] = spreadsheet
+        self._spreadsheets = spreadsheets
+        self._build_indexes(spreadsheet_files)
+
+    def _build_indexes(self, spreadsheet_files: list) -> None:
+        """Index the spreadsheet IDs by title, from a Drive files listing."""
+        self._spreadsheet_ids_by_title: Dict[str, List[str]] = {}
+        for spreadsheet in spreadsheet_files:
+            self._spreadsheet_ids_by_title.setdefault(spreadsheet["name"], []).append(
+                spreadsheet["id"]
+            )
+
+    def _client_for(self, spreadsheet_id: str) -> Client:
+        """Get the gspread client to open a spreadsheet with."""
+        if isinstance(self._gc, ClientPool):
+            return self._gc.client_for(spreadsheet_id)
+        return self._gc
 
     @property
     def spreadsheets(self) -> list:
@@ -35,6 +103,37 @@ class GoogleSheetsConnection:
         """Get a specific spreadsheet by its ID."""
         return self._spreadsheets[spreadsheet_id]
 
+    def find_spreadsheets(self, title: str) -> List[Spreadsheet]:
+        """Get all the spreadsheets with a given title."""
+        return [
+            self._spreadsheets[spreadsheet_id]
+            for spreadsheet_id in self._spreadsheet_ids_by_title.get(title, [])
+        ]
+
+    def get_spreadsheet_by_title(self, title: str) -> Spreadsheet:
+        """Get a specific spreadsheet by its title."""
+        spreadsheets = self.find_spreadsheets(title)
+        if not spreadsheets:
+            raise SpreadsheetNotFoundException(f"No spreadsheet is titled {title!r}")
+        if len(spreadsheets) > 1:
+            raise DuplicateSpreadsheetException(
+                f"{len(spreadsheets)} spreadsheets are titled {title!r}, "
+                "use find_spreadsheets or look them up by ID instead"
+            )
+        return spreadsheets[0]
+
+    def get_spreadsheet_by_url(self, url: str) -> Spreadsheet:
+        """Get a specific spreadsheet by its URL."""
+        return self.get_spreadsheet(extract_id_from_url(url))
+
+    def get_worksheet_by_url(self, url: str) -> Worksheet:
+        """Get a specific worksheet by its URL, defaulting to the first worksheet."""
+        spreadsheet = self.get_spreadsheet_by_url(url)
+        match = GID_REGEX.search(url)
+        if match is None:
+            return spreadsheet.get_worksheet_by_index(0)
+        return spreadsheet.get_worksheet_by_gid(int(match.group(1)))
+
     def __getitem__(self, spreadsheet_id: str) -> Spreadsheet:
         """Make spreadsheets subscriptable."""
         return self.get_spreadsheet(spreadsheet_id)
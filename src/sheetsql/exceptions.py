@@ -17,3 +17,33 @@ class SpreadsheetNotFoundException(Exception):
     """Raises if a spreadsheet is not found."""
 
     pass
+
+
+class DuplicateSpreadsheetException(Exception):
+    """Raises if several spreadsheets match a lookup expecting a single one."""
+
+    pass
+
+
+class QuotaExceededException(Exception):
+    """Raises if every credential able to serve a request is rate limited."""
+
+    pass
+
+
+class InvalidExportFormatException(Exception):
+    """Raises if the export format is invalid."""
+
+    pass
+
+
+class InconsistentExportException(Exception):
+    """Raises if the worksheet changes too much during an export to complete it."""
+
+    pass
+
+
+class InvalidSnapshotException(Exception):
+    """Raises if a file is not a snapshot this version of sheetsql can read."""
+
+    pass
@@ -0,0 +1,362 @@
+"""Export table query results to columnar files."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from typing import TYPE_CHECKING, Any, Iterator, List, Optional
+
+import regex
+
+from .exceptions import (
+    InconsistentExportException,
+    InvalidExportFormatException,
+    InvalidQueryException,
+)
+from .query import TQ_TOKEN_REGEX
+from .utils import convert_tq_value, get_cell_value, tq_column_names
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .worksheet import Worksheet
+
+DEFAULT_CHUNK_SIZE = 10000
+DEFAULT_COMPRESSION = {"parquet": "snappy", "arrow": "lz4"}
+EXPORT_FORMATS = tuple(DEFAULT_COMPRESSION.keys())
+
+
+def _import_pyarrow() -> Any:
+    """Import pyarrow, which is an optional dependency of sheetsql."""
+    try:
+        import pyarrow
+    except ImportError as e:  # pragma: no cover
+        raise ImportError(
+            "pyarrow is required to export worksheets. "
+            "Install it with `pip install sheet-sql[arrow]`"
+        ) from e
+    return pyarrow
+
+
+def tq_schema(cols: list) -> Any:
+    """Build an Arrow schema from the columns of a table query response.
+
+    Args:
+        cols (list): The ``cols`` key of the table query response
+
+    Returns:
+        pyarrow.Schema: Schema with one field per column, typed by the column type
+            and named by ``tq_column_names``
+    """
+    pa = _import_pyarrow()
+    arrow_types = {
+        "boolean": pa.bool_(),
+        "number": pa.float64(),
+        "string": pa.string(),
+        "date": pa.date32(),
+        "datetime": pa.timestamp("ms"),
+        "timeofday": pa.time32("ms"),
+    }
+    return pa.schema(
+        [
+            pa.field(name, arrow_types.get(col["type"], pa.string()))
+            for name, col in zip(tq_column_names(cols), cols)
+        ]
+    )
+
+
+def _record_batch(columns: list, schema: Any) -> Any:
+    """Build an Arrow record batch from lists of column values."""
+    pa = _import_pyarrow()
+    return pa.RecordBatch.from_arrays(
+        [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+        schema=schema,
+    )
+
+
+def iter_record_batches(
+    table: dict, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[Any]:
+    """Convert the rows of a table query response to Arrow record batches.
+
+    Args:
+        table (dict): The table query response table, with ``cols`` and ``rows`` keys
+        chunk_size (int): Maximum number of rows per record batch
+
+    Yields:
+        pyarrow.RecordBatch: Record batches of at most ``chunk_size`` rows
+    """
+    schema = tq_schema(table["cols"])
+    types = [col["type"] for col in table["cols"]]
+    columns: list = [[] for _ in types]
+    num_rows = 0
+    for row in table["rows"]:
+        for values, cell, tq_type in zip(columns, row["c"], types):
+            values.append(convert_tq_value(get_cell_value(cell), tq_type))
+        num_rows += 1
+        if num_rows == chunk_size:
+            yield _record_batch(columns, schema)
+            columns = [[] for _ in types]
+            num_rows = 0
+    if num_rows:
+        yield _record_batch(columns, schema)
+
+
+def check_export_format(format: str) -> None:
+    """Check that an export format is supported.
+
+    Args:
+        format (str): The export format
+
+    Raises:
+        InvalidExportFormatException: if the export format is not supported
+    """
+    if format not in EXPORT_FORMATS:
+        raise InvalidExportFormatException(
+            f"{format} is an invalid export format. "
+            f"Valid export formats are: {', '.join(EXPORT_FORMATS)}"
+        )
+
+
+def write_table(
+    table: dict,
+    path: str,
+    format: str = "parquet",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    compression: Optional[str] = None,
+) -> int:
+    """Write a table query response to a Parquet or Arrow IPC file chunk by chunk.
+
+    Only one record batch of at most ``chunk_size`` rows is held in memory at a time.
+    The file is written next to ``path``, flushed to disk and then moved in place, so
+    a failed write never leaves a partial file at ``path``.
+
+    Args:
+        table (dict): The table query response table, with ``cols`` and ``rows`` keys
+        path (str): Path of the file to write
+        format (str): Either ``parquet`` or ``arrow``
+        chunk_size (int): Maximum number of rows per record batch / row group
+        compression (Optional[str]): Compression codec, defaults to snappy for
+            Parquet and lz4 for Arrow IPC
+
+    Raises:
+        InvalidExportFormatException: if the export format is not supported
+
+    Returns:
+        int: The number of rows written
+    """
+    check_export_format(format)
+    pa = _import_pyarrow()
+    if compression is None:
+        compression = DEFAULT_COMPRESSION[format]
+    schema = tq_schema(table["cols"])
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    num_rows = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            if format == "parquet":
+                import pyarrow.parquet as pq
+
+                writer = pq.ParquetWriter(f, schema, compression=compression)
+            else:
+                writer = pa.ipc.new_file(
+                    f, schema, options=pa.ipc.IpcWriteOptions(compression=compression)
+                )
+            try:
+                for batch in iter_record_batches(table, chunk_size=chunk_size):
+                    if format == "parquet":
+                        writer.write_table(pa.Table.from_batches([batch]))
+                    else:
+                        writer.write_batch(batch)
+                    num_rows += batch.num_rows
+            finally:
+                writer.close()
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return num_rows
+
+
+CHECKPOINT_FILENAME = "_checkpoint.json"
+MAX_RESTARTS = 3
+TQ_TRAILING_CLAUSES_REGEX = regex.compile(r"\b(?:label|format|options)\b", regex.I)
+TQ_PAGING_CLAUSES_REGEX = regex.compile(r"\b(?:limit|offset)\b", regex.I)
+
+
+class ResumableExport:
+    """Export of a worksheet query, page by page, that resumes where it stopped.
+
+    Pages of ``page_size`` rows are fetched in order with ``LIMIT`` and ``OFFSET``,
+    and each one is written to its own Parquet or Arrow IPC part file in
+    ``directory``. After each part file is durably written, the spreadsheet revision
+    is checked again, and a checkpoint with the next offset, a hash of the schema and
+    the revision is saved. Running the export again after a failure continues from
+    the checkpoint, unless the schema or the revision changed, in which case it
+    starts over. The export also starts over when the spreadsheet changes while it
+    runs, since the pages fetched so far may then be inconsistent.
+
+    Args:
+        worksheet (Worksheet): The worksheet to export
+        directory (str): Directory to write the part files and the checkpoint to
+        format (str): Either ``parquet`` or ``arrow``
+        tq (str): Query to export, without ``LIMIT`` or ``OFFSET`` clauses
+        page_size (int): Number of rows per page and part file
+        compression (Optional[str]): Compression codec of the part files
+    """
+
+    def __init__(
+        self,
+        worksheet: Worksheet,
+        directory: str,
+        format: str = "parquet",
+        tq: str = "SELECT *",
+        page_size: int = DEFAULT_CHUNK_SIZE,
+        compression: Optional[str] = None,
+    ) -> None:
+        """Init method for the ResumableExport class."""
+        check_export_format(format)
+        if TQ_PAGING_CLAUSES_REGEX.search(_blank_literals(tq)):
+            raise InvalidQueryException(
+                "Queries exported page by page cannot have LIMIT or OFFSET clauses"
+            )
+        self.worksheet = worksheet
+        self.directory = directory
+        self.format = format
+        self.tq = tq
+        self.page_size = page_size
+        self.compression = compression
+        self.checkpoint_path = os.path.join(directory, CHECKPOINT_FILENAME)
+
+    def _page_tq(self, tq: str, limit: int, offset: int) -> str:
+        """Add paging clauses to a query, before any trailing clauses."""
+        match = TQ_TRAILING_CLAUSES_REGEX.search(_blank_literals(tq))
+        end = len(tq) if match is None else match.start()
+        return f"{tq[:end].rstrip()} LIMIT {limit} OFFSET {offset} {tq[end:]}".rstrip()
+
+    def _part_path(self, part: int) -> str:
+        """Get the path of a part file."""
+        return os.path.join(self.directory, f"part-{part:05d}.{self.format}")
+
+    @property
+    def part_paths(self) -> List[str]:
+        """Get the paths of the part files written so far, in order."""
+        return sorted(
+            os.path.join(self.directory, filename)
+            for filename in os.listdir(self.directory)
+            if filename.startswith("part-") and filename.endswith(f".{self.format}")
+        )
+
+    def load_checkpoint(self) -> Optional[dict]:
+        """Load the checkpoint of a previous run, if any."""
+        try:
+            with open(self.checkpoint_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _save_checkpoint(self, checkpoint: dict) -> None:
+        """Atomically and durably replace the checkpoint."""
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _new_checkpoint(self, tq: str, schema_hash: str, revision: int) -> dict:
+        """Create the checkpoint of an export starting over."""
+        return {
+            "tq": tq,
+            "format": self.format,
+            "page_size": self.page_size,
+            "schema_hash": schema_hash,
+            "revision": revision,
+            "offset": 0,
+            "parts": 0,
+            "complete": False,
+        }
+
+    def _remove_uncommitted_parts(self, checkpoint: dict) -> None:
+        """Remove part files from other runs or not covered by the checkpoint."""
+        committed = {self._part_path(part) for part in range(checkpoint["parts"])}
+        for path in self.part_paths:
+            if path not in committed:
+                os.remove(path)
+
+    def run(self) -> int:
+        """Run the export, resuming from the checkpoint of a previous run if valid.
+
+        Raises:
+            InconsistentExportException: if the schema changes while the export
+                runs, or the spreadsheet keeps changing so the export cannot complete
+
+        Returns:
+            int: The total number of rows exported
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        tq = self.worksheet._update_tq_cols(self.tq)
+        cols = self.worksheet._execute(self._page_tq(tq, 0, 0))["cols"]
+        schema_hash = _schema_hash(cols)
+        revision = self.worksheet.spreadsheet.fetch_revision()
+        checkpoint = self.load_checkpoint()
+        if checkpoint is None or (
+            checkpoint["tq"],
+            checkpoint["format"],
+            checkpoint["page_size"],
+            checkpoint["schema_hash"],
+            checkpoint["revision"],
+        ) != (tq, self.format, self.page_size, schema_hash, revision):
+            checkpoint = self._new_checkpoint(tq, schema_hash, revision)
+        self._remove_uncommitted_parts(checkpoint)
+        restarts = 0
+        while not checkpoint["complete"]:
+            page = self.worksheet._execute(
+                self._page_tq(tq, self.page_size, checkpoint["offset"])
+            )
+            if _schema_hash(page["cols"]) != schema_hash:
+                raise InconsistentExportException(
+                    f"The schema of {self.worksheet} changed during the export"
+                )
+            rows = list(page["rows"])
+            if rows or not checkpoint["parts"]:
+                write_table(
+                    {"cols": page["cols"], "rows": rows},
+                    self._part_path(checkpoint["parts"]),
+                    format=self.format,
+                    chunk_size=self.page_size,
+                    compression=self.compression,
+                )
+                checkpoint["parts"] += 1
+            checkpoint["offset"] += len(rows)
+            checkpoint["complete"] = len(rows) < self.page_size
+            revision = self.worksheet.spreadsheet.fetch_revision()
+            if revision != checkpoint["revision"]:
+                # Edits shift the LIMIT and OFFSET pages, so start over
+                if restarts == MAX_RESTARTS:
+                    raise InconsistentExportException(
+                        f"{self.worksheet} changed {restarts + 1} times during the "
+                        "export"
+                    )
+                restarts += 1
+                checkpoint = self._new_checkpoint(tq, schema_hash, revision)
+                self._save_checkpoint(checkpoint)
+                self._remove_uncommitted_parts(checkpoint)
+                continue
+            self._save_checkpoint(checkpoint)
+        return checkpoint["offset"]
+
+
+def _blank_literals(tq: str) -> str:
+    """Blank out the string literals of a query, keeping its length."""
+    return TQ_TOKEN_REGEX.sub(
+        lambda m: " " * len(m.group()) if m.group("literal") else m.group(), tq
+    )
+
+
+def _schema_hash(cols: list) -> str:
+    """Hash the column IDs, labels and types of a table query response."""
+    schema = [[col["id"], col["label"], col["type"]] for col in cols]
+    return hashlib.sha256(json.dumps(schema).encode("utf-8")).hexdigest()
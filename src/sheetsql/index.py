@@ -0,0 +1,162 @@
+"""In-memory indexes over worksheets for local lookups."""
+
+from __future__ import annotations
+
+import bisect
+import logging
+import threading
+from typing import TYPE_CHECKING, Any, Iterable, List, Optional
+
+from .utils import convert_tq_value, get_cell_value
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .worksheet import Worksheet
+
+logger = logging.getLogger(__name__)
+
+
+class _IndexState:
+    """Immutable snapshot of the indexed rows, swapped in whole on refresh."""
+
+    def __init__(
+        self, revision: Optional[int], by_key: dict, sorted_indexes: dict
+    ) -> None:
+        """Init method for the _IndexState class."""
+        self.revision = revision
+        self.by_key = by_key
+        self.sorted_indexes = sorted_indexes
+
+
+class WorksheetIndex:
+    """Hash index over the rows of a worksheet, keyed by one column.
+
+    The worksheet is loaded once, and lookups are then served from memory. Columns
+    listed in ``sorted_columns``, along with the key column, also get a sorted
+    index for range lookups. Keys are expected to be unique: when they are not, the
+    last row with a given key is the one returned.
+
+    With a ``refresh_interval``, a background thread checks the spreadsheet
+    revision every ``refresh_interval`` seconds and reloads the worksheet when it
+    changed. The new indexes are swapped in at once, so readers never block and
+    never see a partially loaded index.
+
+    Args:
+        worksheet (Worksheet): The worksheet to index
+        key_column (str): Label of the column to index the rows by
+        sorted_columns (Optional[Iterable[str]]): Labels of columns to range index
+        refresh_interval (Optional[float]): Seconds between background refreshes
+    """
+
+    def __init__(
+        self,
+        worksheet: Worksheet,
+        key_column: str,
+        sorted_columns: Optional[Iterable[str]] = None,
+        refresh_interval: Optional[float] = None,
+    ) -> None:
+        """Init method for the WorksheetIndex class."""
+        self.worksheet = worksheet
+        self.key_column = key_column
+        self.sorted_columns = list(dict.fromkeys([key_column, *(sorted_columns or [])]))
+        self.refresh_interval = refresh_interval
+        self._state = self._load(self.worksheet.spreadsheet.fetch_revision())
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if refresh_interval is not None:
+            self._thread = threading.Thread(target=self._refresh_periodically)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _load(self, revision: Optional[int]) -> _IndexState:
+        """Load the worksheet and build the indexes."""
+        result = self.worksheet._execute("SELECT *")
+        labels = [col["label"] for col in result["cols"]]
+        types = [col["type"] for col in result["cols"]]
+        rows = [
+            {
+                label: convert_tq_value(get_cell_value(cell), tq_type)
+                for label, cell, tq_type in zip(labels, row["c"], types)
+            }
+            for row in result["rows"]
+        ]
+        by_key = {row[self.key_column]: row for row in rows}
+        sorted_indexes = {}
+        for column in self.sorted_columns:
+            entries = sorted(
+                (
+                    (row[column], i)
+                    for i, row in enumerate(rows)
+                    if row[column] is not None
+                ),
+                key=lambda entry: entry[0],
+            )
+            sorted_indexes[column] = (
+                [value for value, _ in entries],
+                [rows[i] for _, i in entries],
+            )
+        return _IndexState(revision, by_key, sorted_indexes)
+
+    def refresh(self, force: bool = False) -> bool:
+        """Reload the worksheet if its spreadsheet revision changed.
+
+        Returns:
+            bool: Whether the worksheet was reloaded
+        """
+        revision = self.worksheet.spreadsheet.fetch_revision()
+        if not force and revision == self._state.revision:
+            return False
+        self._state = self._load(revision)
+        return True
+
+    def _refresh_periodically(self) -> None:
+        """Refresh the index until stopped, keeping the current one on errors."""
+        while not self._stopped.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Failed to refresh the index of %s", self.worksheet)
+
+    def stop(self) -> None:
+        """Stop refreshing the index in the background."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    @property
+    def revision(self) -> Optional[int]:
+        """Get the spreadsheet revision the index was loaded from."""
+        return self._state.revision
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        """Get the row with a given key."""
+        return self._state.by_key.get(key, default)
+
+    def get_many(self, keys: Iterable[Any]) -> List[Optional[dict]]:
+        """Get the rows with the given keys, None for keys that are not found."""
+        by_key = self._state.by_key
+        return [by_key.get(key) for key in keys]
+
+    def range(
+        self, lo: Any = None, hi: Any = None, column: Optional[str] = None
+    ) -> List[dict]:
+        """Get the rows whose column value is between lo and hi, inclusive.
+
+        Either bound can be left out. The column defaults to the key column and must
+        be the key column or one of the sorted columns.
+        """
+        values, rows = self._state.sorted_indexes[column or self.key_column]
+        start = 0 if lo is None else bisect.bisect_left(values, lo)
+        end = len(values) if hi is None else bisect.bisect_right(values, hi)
+        return rows[start:end]
+
+    def __getitem__(self, key: Any) -> dict:
+        """Make the index subscriptable by key."""
+        return self._state.by_key[key]
+
+    def __contains__(self, key: Any) -> bool:
+        """Check whether a row has the given key."""
+        return key in self._state.by_key
+
+    def __len__(self) -> int:
+        """Get number of indexed keys."""
+        return len(self._state.by_key)
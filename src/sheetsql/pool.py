@@ -0,0 +1,199 @@
+"""Pool of gspread clients to spread requests across several credentials."""
+
+import itertools
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from gspread import Client
+from gspread.exceptions import APIError, GSpreadException
+from requests import Response
+
+from .exceptions import QuotaExceededException, SpreadsheetNotFoundException
+from .utils import TQ_BASE_URL
+
+DEFAULT_COOLDOWN = 60.0
+ROUTING_STRATEGIES = ("round_robin", "least_loaded")
+
+
+class PooledCredential:
+    """A gspread client in a ClientPool, along with its quota usage."""
+
+    def __init__(self, client: Client, name: str) -> None:
+        """Init method for the PooledCredential class."""
+        self.client = client
+        self.name = name
+        self.spreadsheet_ids: set = set()
+        self.in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+        self.cooldown_until = 0.0
+
+    def __repr__(self) -> str:
+        """Represent the credential by its name and usage."""
+        return (
+            f"<PooledCredential {self.name!r} requests:{self.requests} "
+            f"throttled:{self.throttled}>"
+        )
+
+    @property
+    def cooling_down(self) -> bool:
+        """Whether the credential is waiting out a rate limit (HTTP 429)."""
+        return time.monotonic() < self.cooldown_until
+
+
+class ClientPool:
+    """Route requests across gspread clients authorized with different credentials.
+
+    Each spreadsheet is only routed to the credentials that listed it. A credential
+    that gets rate limited (HTTP 429) cools down for the ``Retry-After`` period, or
+    ``cooldown`` seconds, while the request fails over to the next credential.
+
+    Args:
+        clients (List[Client]): gspread clients, one per credential
+        strategy (str): Either ``round_robin`` or ``least_loaded``
+        cooldown (float): Seconds to skip a credential after it is rate limited
+        names (Optional[List[str]]): Names identifying the credentials
+    """
+
+    def __init__(
+        self,
+        clients: List[Client],
+        strategy: str = "round_robin",
+        cooldown: float = DEFAULT_COOLDOWN,
+        names: Optional[List[str]] = None,
+    ) -> None:
+        """Init method for the ClientPool class."""
+        if strategy not in ROUTING_STRATEGIES:
+            raise GSpreadException(
+                f"{strategy} is not a supported routing strategy "
+                f"(supported strategies are: {', '.join(ROUTING_STRATEGIES)})"
+            )
+        if names is None:
+            names = [f"credential_{i}" for i in range(len(clients))]
+        self.credentials = [
+            PooledCredential(client, name) for client, name in zip(clients, names)
+        ]
+        self.strategy = strategy
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        """Get number of credentials."""
+        return len(self.credentials)
+
+    def list_spreadsheet_files(self) -> List[dict]:
+        """List the spreadsheets any credential has access to, recording access."""
+        files: Dict[str, dict] = {}
+        for credential in self.credentials:
+            credential_files = credential.client.list_spreadsheet_files()
+            credential.spreadsheet_ids = {file["id"] for file in credential_files}
+            for file in credential_files:
+                files.setdefault(file["id"], file)
+        return list(files.values())
+
+    def client_for(self, spreadsheet_id: str) -> "PooledClient":
+        """Get a gspread client routing requests for a spreadsheet across the pool."""
+        return PooledClient(self, spreadsheet_id)
+
+    def _acquire(self, spreadsheet_id: str, tried: set) -> PooledCredential:
+        """Pick a credential able to access the spreadsheet and mark it in flight."""
+        with self._lock:
+            candidates = [
+                credential
+                for credential in self.credentials
+                if spreadsheet_id in credential.spreadsheet_ids
+            ]
+            if not candidates:
+                raise SpreadsheetNotFoundException(
+                    f"No credential in the pool has access to {spreadsheet_id}"
+                )
+            available = [
+                credential
+                for credential in candidates
+                if credential not in tried and not credential.cooling_down
+            ]
+            if not available:
+                raise QuotaExceededException(
+                    f"Every credential with access to {spreadsheet_id} is rate limited"
+                )
+            if self.strategy == "least_loaded":
+                credential = min(available, key=lambda c: (c.in_flight, c.requests))
+            else:
+                credential = available[next(self._counter) % len(available)]
+            credential.in_flight += 1
+            credential.requests += 1
+            return credential
+
+    def _release(self, credential: PooledCredential) -> None:
+        """Mark a request made with the credential as finished."""
+        with self._lock:
+            credential.in_flight -= 1
+
+    def _throttle(self, credential: PooledCredential, response: Response) -> None:
+        """Put a rate limited credential in cooldown."""
+        try:
+            cooldown = float(response.headers.get("Retry-After", self.cooldown))
+        except ValueError:
+            cooldown = self.cooldown
+        with self._lock:
+            credential.throttled += 1
+            credential.cooldown_until = time.monotonic() + cooldown
+
+    def request(
+        self, spreadsheet_id: str, send: Callable[[Client], Response]
+    ) -> Response:
+        """Send a request for a spreadsheet, failing over on rate limits.
+
+        Args:
+            spreadsheet_id (str): ID of the spreadsheet the request is for
+            send (Callable[[Client], Response]): Sends the request with a client
+
+        Raises:
+            QuotaExceededException: if every eligible credential is rate limited
+            SpreadsheetNotFoundException: if no credential can access the spreadsheet
+
+        Returns:
+            Response: The first response that was not rate limited
+        """
+        tried: set = set()
+        while True:
+            credential = self._acquire(spreadsheet_id, tried)
+            tried.add(credential)
+            try:
+                response = send(credential.client)
+            except APIError as e:
+                if e.response.status_code != 429:
+                    raise
+                response = e.response
+            finally:
+                self._release(credential)
+            if response.status_code != 429:
+                return response
+            self._throttle(credential, response)
+            response.close()
+
+
+class PooledClient(Client):
+    """gspread client sending the requests for one spreadsheet through a ClientPool."""
+
+    def __init__(self, pool: ClientPool, spreadsheet_id: str) -> None:
+        """Init method for the PooledClient class."""
+        super().__init__(None)
+        self.pool = pool
+        self.spreadsheet_id = spreadsheet_id
+
+    def request(self, method: str, endpoint: str, **kwargs: Any) -> Response:
+        """Send a Google API request with one of the pooled credentials."""
+        return self.pool.request(
+            self.spreadsheet_id,
+            lambda client: client.request(method, endpoint, **kwargs),
+        )
+
+    def tq_request(self, params: dict) -> Response:
+        """Send an authorized, streamed table query with one of the credentials."""
+        return self.pool.request(
+            self.spreadsheet_id,
+            lambda client: client.session.get(TQ_BASE_URL, params=params, stream=True),
+        )
@@ -0,0 +1,889 @@
+"""Prepared table queries and the table query builder."""
+
+from __future__ import annotations
+
+import copy
+import itertools
+import operator
+import re
+from abc import ABC, abstractmethod
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+import regex
+
+from .exceptions import InvalidQueryException
+from .utils import convert_tq_value, format_tq_literal, get_cell_value
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .worksheet import Worksheet
+
+TQ_TOKEN_REGEX = regex.compile(
+    r"""(?P<literal>'[^']*'|"[^"]*"|`[^`]*`)|(?P<param>:[A-Za-z_]\w*)"""
+)
+WHITESPACE_REGEX = regex.compile(r"\s+")
+
+
+class Param(str):
+    """Name of a parameter placeholder in a compiled query."""
+
+    pass
+
+
+class PreparedQuery:
+    """A table query compiled once and executed many times with bound parameters.
+
+    Column labels are rewritten to column identifiers and whitespace is normalized
+    when the query is prepared. Parameters are written as ``:name`` placeholders
+    and bound as typed, correctly quoted table query literals.
+    """
+
+    def __init__(self, worksheet: Worksheet, tq: str) -> None:
+        """Init method for the PreparedQuery class."""
+        self.worksheet = worksheet
+        self.tq = tq
+        self._parts = self._compile(tq, worksheet.column_label_id_map)
+        self.params = tuple(
+            dict.fromkeys(part for part in self._parts if isinstance(part, Param))
+        )
+
+    def __repr__(self) -> str:
+        """Represent the prepared query by its source."""
+        return f"<PreparedQuery {self.tq!r}>"
+
+    def _compile(self, tq: str, column_label_id_map: dict) -> List[str]:
+        """Split the query into rewritten text and parameter placeholders."""
+        parts: List[str] = []
+        pos = 0
+        for match in TQ_TOKEN_REGEX.finditer(tq):
+            parts.append(
+                self.worksheet._update_tq_cols(
+                    WHITESPACE_REGEX.sub(" ", tq[pos : match.start()]),
+                    column_label_id_map=column_label_id_map,
+                )
+            )
+            if match.group("param"):
+                parts.append(Param(match.group("param")[1:]))
+            else:
+                parts.append(match.group("literal"))
+            pos = match.end()
+        parts.append(
+            self.worksheet._update_tq_cols(
+                WHITESPACE_REGEX.sub(" ", tq[pos:]),
+                column_label_id_map=column_label_id_map,
+            )
+        )
+        parts[0] = parts[0].lstrip()
+        parts[-1] = parts[-1].rstrip()
+        return parts
+
+    def bind(self, **params: Any) -> str:
+        """Bind parameters to the query, returning the table query to send."""
+        missing = set(self.params) - set(params)
+        if missing:
+            raise InvalidQueryException(
+                f"Missing values for parameters: {', '.join(sorted(missing))}"
+            )
+        unknown = set(params) - set(self.params)
+        if unknown:
+            raise InvalidQueryException(
+                f"Unknown parameters: {', '.join(sorted(unknown))}"
+            )
+        literals = {name: format_tq_literal(value) for name, value in params.items()}
+        return "".join(
+            literals[part] if isinstance(part, Param) else part for part in self._parts
+        )
+
+    def cache_key(self, **params: Any) -> Tuple[Union[str, int], ...]:
+        """Get a stable key identifying the query bound with the given parameters.
+
+        Queries that differ only in whitespace or in using column labels instead of
+        column identifiers share the same key.
+        """
+        return (self.worksheet.spreadsheet.id, self.worksheet.id, self.bind(**params))
+
+    def query(
+        self, row_type: Any[Dict, List, Tuple] = None, **params: Any
+    ) -> Generator[Any[Dict, List, Tuple], None, None]:
+        """Execute the query with the given parameters."""
+        result = self.worksheet._execute(self.bind(**params))
+        return self.worksheet._result_handler(result, row_type=row_type)
+
+
+def _column_id(name: str, column_label_id_map: dict) -> str:
+    """Get the identifier of a column from its label.
+
+    Rows evaluated locally are keyed by column label, so built queries reference
+    columns by label only, never by identifier.
+    """
+    if name in column_label_id_map:
+        return column_label_id_map[name]
+    raise InvalidQueryException(f"{name} is not the label of a column of the worksheet")
+
+
+def _compile_pushed(expression: Expression, column_label_id_map: dict) -> str:
+    """Compile an expression that must be pushed down to table query."""
+    compiled = expression.compile(column_label_id_map)
+    if compiled is None:
+        raise InvalidQueryException(f"{expression!r} cannot be expressed in tq")
+    return compiled
+
+
+class Expression(ABC):
+    """Expression in a built query, compiled to table query or evaluated locally."""
+
+    _alias: Optional[str] = None
+
+    @abstractmethod
+    def compile(self, column_label_id_map: dict) -> Optional[str]:
+        """Compile the expression to table query, or None if tq cannot express it."""
+
+    @abstractmethod
+    def evaluate(self, row: dict) -> Any:
+        """Evaluate the expression locally against a row keyed by column label."""
+
+    @property
+    def columns(self) -> Optional[List[str]]:
+        """Get the labels of the columns the expression uses, None if unknown."""
+        return []
+
+    @property
+    def label(self) -> str:
+        """Get the label of the expression in query results."""
+        return self._alias or repr(self)
+
+    def alias(self, label: str) -> Expression:
+        """Label the expression in query results."""
+        expression = copy.copy(self)
+        expression._alias = label
+        return expression
+
+    def _compare(self, op: str, other: Any) -> Comparison:
+        """Compare the expression with another expression or a literal."""
+        if other is None:
+            raise InvalidQueryException(
+                f"Blank values cannot be compared with {op}, "
+                "use is_null() or is_not_null() instead"
+            )
+        if not isinstance(other, Expression):
+            other = Literal(other)
+        return Comparison(op, self, other)
+
+    def __eq__(self, other: Any) -> Predicate:  # type: ignore
+        """Build an equality predicate, matching blank values if other is None."""
+        if other is None:
+            return self.is_null()
+        return self._compare("=", other)
+
+    def __ne__(self, other: Any) -> Predicate:  # type: ignore
+        """Build an inequality predicate, matching non-blank values if other is None."""
+        if other is None:
+            return self.is_not_null()
+        return self._compare("!=", other)
+
+    def __lt__(self, other: Any) -> Comparison:
+        """Build a less than predicate."""
+        return self._compare("<", other)
+
+    def __le__(self, other: Any) -> Comparison:
+        """Build a less than or equal predicate."""
+        return self._compare("<=", other)
+
+    def __gt__(self, other: Any) -> Comparison:
+        """Build a greater than predicate."""
+        return self._compare(">", other)
+
+    def __ge__(self, other: Any) -> Comparison:
+        """Build a greater than or equal predicate."""
+        return self._compare(">=", other)
+
+    __hash__ = object.__hash__
+
+    def __bool__(self) -> bool:
+        """Refuse to use expressions as booleans, which would drop predicates."""
+        raise TypeError(
+            f"{self!r} cannot be used as a boolean. Combine predicates with "
+            "& (and), | (or) and ~ (not) instead of and, or, not and chained "
+            "comparisons"
+        )
+
+    def contains(self, other: Any) -> Comparison:
+        """Build a predicate matching strings containing a substring."""
+        return self._compare("contains", other)
+
+    def startswith(self, other: Any) -> Comparison:
+        """Build a predicate matching strings starting with a prefix."""
+        return self._compare("starts with", other)
+
+    def endswith(self, other: Any) -> Comparison:
+        """Build a predicate matching strings ending with a suffix."""
+        return self._compare("ends with", other)
+
+    def matches(self, pattern: str) -> Comparison:
+        """Build a predicate matching strings fully matching a regular expression."""
+        return self._compare("matches", pattern)
+
+    def like(self, pattern: str) -> Comparison:
+        """Build a predicate matching strings against a ``%`` and ``_`` pattern."""
+        return self._compare("like", pattern)
+
+    def isin(self, values: Iterable[Any]) -> Predicate:
+        """Build a predicate matching any of the given values."""
+        return Or(*(self == value for value in values))
+
+    def is_null(self) -> Predicate:
+        """Build a predicate matching blank values."""
+        return IsNull(self)
+
+    def is_not_null(self) -> Predicate:
+        """Build a predicate matching non-blank values."""
+        return Not(IsNull(self))
+
+    def apply(self, func: Callable[[Any], Any]) -> Expression:
+        """Transform the expression with a Python function, evaluated locally."""
+        return Computed(func, self)
+
+    def asc(self) -> Ordering:
+        """Order results by the expression in ascending order."""
+        return Ordering(self, descending=False)
+
+    def desc(self) -> Ordering:
+        """Order results by the expression in descending order."""
+        return Ordering(self, descending=True)
+
+
+class Column(Expression):
+    """Column of the worksheet, referenced by its label."""
+
+    def __init__(self, name: str) -> None:
+        """Init method for the Column class."""
+        self.name = name
+
+    def __repr__(self) -> str:
+        """Represent the column as built."""
+        return f"col({self.name!r})"
+
+    @property
+    def label(self) -> str:
+        """Get the label of the column in query results."""
+        return self._alias or self.name
+
+    @property
+    def columns(self) -> Optional[List[str]]:
+        """Get the labels of the columns the expression uses."""
+        return [self.name]
+
+    def compile(self, column_label_id_map: dict) -> Optional[str]:
+        """Compile the column to its identifier."""
+        return _column_id(self.name, column_label_id_map)
+
+    def evaluate(self, row: dict) -> Any:
+        """Get the value of the column."""
+        return row[self.name]
+
+    def _aggregate(self, function: str) -> Aggregate:
+        """Aggregate the column."""
+        return Aggregate(function, self)
+
+    def sum(self) -> Aggregate:
+        """Sum the column over each group."""
+        return self._aggregate("sum")
+
+    def avg(self) -> Aggregate:
+        """Average the column over each group."""
+        return self._aggregate("avg")
+
+    def min(self) -> Aggregate:
+        """Get the minimum of the column over each group."""
+        return self._aggregate("min")
+
+    def max(self) -> Aggregate:
+        """Get the maximum of the column over each group."""
+        return self._aggregate("max")
+
+    def count(self) -> Aggregate:
+        """Count the non-blank values of the column over each group."""
+        return self._aggregate("count")
+
+
+def col(name: str) -> Column:
+    """Get a worksheet column by its label, to build queries with."""
+    return Column(name)
+
+
+class Literal(Expression):
+    """Python value used in a built query."""
+
+    def __init__(self, value: Any) -> None:
+        """Init method for the Literal class."""
+        self.value = value
+
+    def __repr__(self) -> str:
+        """Represent the literal by its value."""
+        return repr(self.value)
+
+    def compile(self, column_label_id_map: dict) -> Optional[str]:
+        """Compile the value to a table query literal, if it can be expressed.
+
+        Strings containing both quote characters cannot be quoted in table query, so
+        they are compared locally. Other values that are not valid literals, such as
+        timezone-aware datetimes or NaN, raise an exception.
+        """
+        if isinstance(self.value, str) and '"' in self.value and "'" in self.value:
+            return None
+        return format_tq_literal(self.value)
+
+    def evaluate(self, row: dict) -> Any:
+        """Get the value."""
+        return self.value
+
+
+class Aggregate(Expression):
+    """Aggregation of a column, only computed by Google Sheets."""
+
+    def __init__(self, function: str, column: Column) -> None:
+        """Init method for the Aggregate class."""
+        self.function = function
+        self.column = column
+
+    def __repr__(self) -> str:
+        """Represent the aggregate as built."""
+        return f"{self.column!r}.{self.function}()"
+
+    @property
+    def columns(self) -> Optional[List[str]]:
+        """Get the labels of the columns the expression uses."""
+        return self.column.columns
+
+    def compile(self, column_label_id_map: dict) -> Optional[str]:
+        """Compile the aggregate to a table query aggregation function."""
+        return f"{self.function}({self.column.compile(column_label_id_map)})"
+
+    def evaluate(self, row: dict) -> Any:
+        """Refuse to evaluate the aggregate, which only Google Sheets computes."""
+        raise InvalidQueryException(f"{self!r} cannot be evaluated locally")
+
+
+class Computed(Expression):
+    """Python function applied to an expression, evaluated locally."""
+
+    def __init__(self, func: Callable[[Any], Any], expression: Expression) -> None:
+        """Init method for the Computed class."""
+        self.func = func
+        self.expression = expression
+
+    def __repr__(self) -> str:
+        """Represent the computed expression as built."""
+        return f"{self.expression!r}.apply({getattr(self.func, '__name__', self.func)})"
+
+    @property
+    def columns(self) -> Optional[List[str]]:
+        """Get the labels of the columns the expression uses."""
+        return self.expression.columns
+
+    def compile(self, column_label_id_map: dict) -> Optional[str]:
+        """Python functions cannot be expressed in table query."""
+        return None
+
+    def evaluate(self, row: dict) -> Any:
+        """Apply the function to the value of the expression, unless it is blank."""
+        value = self.expression.evaluate(row)
+        return None if value is None else self.func(value)
+
+
+class Predicate(Expression):
+    """Boolean expression filtering the rows of a built query."""
+
+    def __and__(self, other: Predicate) -> Predicate:
+        """Combine predicates with and."""
+        return And(self, other)
+
+    def __or__(self, other: Predicate) -> Predicate:
+        """Combine predicates with or."""
+        return Or(self, other)
+
+    def __invert__(self) -> Predicate:
+        """Negate the predicate."""
+        return Not(self)
+
+
+def _like(value: str, pattern: str) -> bool:
+    """Match a string against a table query like pattern."""
+    expression = "".join(
+        ".*" if char == "%" else "." if char == "_" else re.escape(char)
+        for char in pattern
+    )
+    return re.fullmatch(expression, value, flags=re.DOTALL) is not None
+
+
+class Comparison(Predicate):
+    """Comparison of two expressions."""
+
+    _operators: Dict[str, Callable[[Any, Any], bool]] = {
+        "=": operator.eq,
+        "!=": operator.ne,
+        "<": operator.lt,
+        "<=": operator.le,
+        ">": operator.gt,
+        ">=": operator.ge,
+        "contains": lambda value, other: other in value,
+        "starts with": lambda value, other: value.startswith(other),
+        "ends with": lambda value, other: value.endswith(other),
+        "matches": lambda value, pattern: re.fullmatch(pattern, value) is not None,
+        "like": _like,
+    }
+    _reprs = {
+        "contains": "contains",
+        "starts with": "startswith",
+        "ends with": "endswith",
+        "matches": "matches",
+        "like": "like",
+    }
+
+    def __init__(self, op: str, left: Expression, right: Expression) -> None:
+        """Init method for the Comparison class."""
+        self.op = op
+        self.left = left
+        self.right = right
+
+    def __repr__(self) -> str:
+        """Represent the comparison as built."""
+        if self.op in self._reprs:
+            return f"{self.left!r}.{self._reprs[self.op]}({self.right!r})"
+        return f"{self.left!r} {'==' if self.op == '=' else self.op} {self.right!r}"
+
+    @property
+    def columns(self) -> Optional[List[str]]:
+        """Get the labels of the columns the expression uses."""
+        return _merge_columns([self.left, self.right])
+
+    def compile(self, column_label_id_map: dict) -> Optional[str]:
+        """Compile the comparison, if both sides can be expressed in table query."""
+        left = self.left.compile(column_label_id_map)
+        right = self.right.compile(column_label_id_map)
+        if left is None or right is None:
+            return None
+        return f"{left} {self.op} {right}"
+
+    def evaluate(self, row: dict) -> bool:
+        """Compare the values, blank values never matching like in table query."""
+        left = self.left.evaluate(row)
+        right = self.right.evaluate(row)
+        if left is None or right is None:
+            return False
+        try:
+            return bool(self._operators[self.op](left, right))
+        except (TypeError, AttributeError):
+            return False
+
+
+class IsNull(Predicate):
+    """Predicate matching blank values."""
+
+    def __init__(self, expression: Expression) -> None:
+        """Init method for the IsNull class."""
+        self.expression = expression
+
+    def __repr__(self) -> str:
+        """Represent the predicate as built."""
+        return f"{self.expression!r}.is_null()"
+
+    @property
+    def columns(self) -> Optional[List[str]]:
+        """Get the labels of the columns the expression uses."""
+        return self.expression.columns
+
+    def compile(self, column_label_id_map: dict) -> Optional[str]:
+        """Compile the predicate, if its expression can be expressed in tq."""
+        expression = self.expression.compile(column_label_id_map)
+        return None if expression is None else f"{expression} is null"
+
+    def evaluate(self, row: dict) -> bool:
+        """Check whether the value is blank."""
+        return self.expression.evaluate(row) is None
+
+
+class And(Predicate):
+    """Conjunction of predicates."""
+
+    _keyword = "and"
+
+    def __init__(self, *predicates: Predicate) -> None:
+        """Init method for the And class."""
+        self.predicates = predicates
+
+    def __repr__(self) -> str:
+        """Represent the conjunction as built."""
+        symbol = " & " if self._keyword == "and" else " | "
+        return f"({symbol.join(repr(predicate) for predicate in self.predicates)})"
+
+    @property
+    def columns(self) -> Optional[List[str]]:
+        """Get the labels of the columns the expression uses."""
+        return _merge_columns(self.predicates)
+
+    def compile(self, column_label_id_map: dict) -> Optional[str]:
+        """Compile the predicates, if they can all be expressed in table query."""
+        compiled = [
+            predicate.compile(column_label_id_map) for predicate in self.predicates
+        ]
+        if not compiled or None in compiled:
+            return None
+        return f"({f' {self._keyword} '.join(compiled)})"  # type: ignore
+
+    def evaluate(self, row: dict) -> bool:
+        """Check whether all the predicates match."""
+        return all(predicate.evaluate(row) for predicate in self.predicates)
+
+
+class Or(And):
+    """Disjunction of predicates."""
+
+    _keyword = "or"
+
+    def evaluate(self, row: dict) -> bool:
+        """Check whether any of the predicates match."""
+        return any(predicate.evaluate(row) for predicate in self.predicates)
+
+
+class Not(Predicate):
+    """Negation of a predicate."""
+
+    def __init__(self, predicate: Predicate) -> None:
+        """Init method for the Not class."""
+        self.predicate = predicate
+
+    def __repr__(self) -> str:
+        """Represent the negation as built."""
+        if isinstance(self.predicate, IsNull):
+            return f"{self.predicate.expression!r}.is_not_null()"
+        return f"~{self.predicate!r}"
+
+    @property
+    def columns(self) -> Optional[List[str]]:
+        """Get the labels of the columns the expression uses."""
+        return self.predicate.columns
+
+    def compile(self, column_label_id_map: dict) -> Optional[str]:
+        """Compile the negation, if the predicate can be expressed in table query."""
+        predicate = self.predicate.compile(column_label_id_map)
+        if predicate is not None and isinstance(self.predicate, IsNull):
+            return f"{predicate[: -len('is null')]}is not null"
+        return None if predicate is None else f"not ({predicate})"
+
+    def evaluate(self, row: dict) -> bool:
+        """Check whether the predicate does not match."""
+        return not self.predicate.evaluate(row)
+
+
+class LocalPredicate(Predicate):
+    """Python function filtering rows, evaluated locally."""
+
+    def __init__(self, func: Callable[[dict], bool]) -> None:
+        """Init method for the LocalPredicate class."""
+        self.func = func
+
+    def __repr__(self) -> str:
+        """Represent the predicate by its function."""
+        return getattr(self.func, "__name__", repr(self.func))
+
+    @property
+    def columns(self) -> Optional[List[str]]:
+        """The columns used by a Python function are unknown."""
+        return None
+
+    def compile(self, column_label_id_map: dict) -> Optional[str]:
+        """Python functions cannot be expressed in table query."""
+        return None
+
+    def evaluate(self, row: dict) -> bool:
+        """Call the function with the row."""
+        return bool(self.func(row))
+
+
+def _merge_columns(expressions: Iterable[Expression]) -> Optional[List[str]]:
+    """Merge the columns used by expressions, None if any of them is unknown."""
+    columns: List[str] = []
+    for expression in expressions:
+        if expression.columns is None:
+            return None
+        columns.extend(expression.columns)
+    return list(dict.fromkeys(columns))
+
+
+def _check_type(expression: Any, types: Tuple[type, ...], usage: str) -> Any:
+    """Check that an expression passed to a query builder method can be used there."""
+    if not isinstance(expression, types):
+        raise InvalidQueryException(f"{expression!r} cannot be {usage}")
+    return expression
+
+
+class Ordering:
+    """Ordering of built query results by an expression."""
+
+    def __init__(self, expression: Expression, descending: bool = False) -> None:
+        """Init method for the Ordering class."""
+        self.expression = expression
+        self.descending = descending
+
+    def __repr__(self) -> str:
+        """Represent the ordering as built."""
+        return f"{self.expression!r}.{'desc' if self.descending else 'asc'}()"
+
+
+class QueryPlan:
+    """Split of a built query into a table query and local processing steps."""
+
+    def __init__(
+        self,
+        tq: str,
+        local_predicates: List[Predicate],
+        local_projection: Optional[List[Expression]],
+        local_offset: Optional[int],
+        local_limit: Optional[int],
+    ) -> None:
+        """Init method for the QueryPlan class."""
+        self.tq = tq
+        self.local_predicates = local_predicates
+        self.local_projection = local_projection
+        self.local_offset = local_offset
+        self.local_limit = local_limit
+
+    def __str__(self) -> str:
+        """Describe the plan."""
+        steps = [f"filter {predicate!r}" for predicate in self.local_predicates]
+        if self.local_offset:
+            steps.append(f"offset {self.local_offset}")
+        if self.local_limit is not None:
+            steps.append(f"limit {self.local_limit}")
+        if self.local_projection is not None:
+            steps.append(
+                f"project {', '.join(item.label for item in self.local_projection)}"
+            )
+        return f"tq: {self.tq}\nlocal: {'; '.join(steps) or 'none'}"
+
+
+class Query:
+    """Composable query on a worksheet, pushed down to table query where possible.
+
+    Selected columns, predicates, grouping, ordering and limits are compiled to
+    table query, so only the needed rows and columns are downloaded. Predicates tq
+    cannot express, like Python functions, are evaluated locally after the pushed
+    down query, along with the limit, offset and projection they depend on. Values
+    in the results are converted to the Python type matching their column type.
+    """
+
+    def __init__(self, worksheet: Worksheet) -> None:
+        """Init method for the Query class."""
+        self.worksheet = worksheet
+        self._select: List[Expression] = []
+        self._where: List[Predicate] = []
+        self._group_by: List[Column] = []
+        self._order_by: List[Ordering] = []
+        self._limit: Optional[int] = None
+        self._offset: Optional[int] = None
+
+    def _copy(self, **changes: Any) -> Query:
+        """Copy the query with some changes, leaving the original unchanged."""
+        query = copy.copy(self)
+        for attribute, value in changes.items():
+            setattr(query, f"_{attribute}", value)
+        return query
+
+    def select(self, *columns: Union[str, Expression]) -> Query:
+        """Select columns, aggregates or computed expressions."""
+        return self._copy(
+            select=self._select
+            + [
+                _check_type(
+                    col(column) if isinstance(column, str) else column,
+                    (Column, Aggregate, Computed),
+                    "selected, use apply() to compute values locally",
+                )
+                for column in columns
+            ]
+        )
+
+    def where(self, *predicates: Union[Predicate, Callable[[dict], bool]]) -> Query:
+        """Filter the rows with predicates, or Python functions of the row."""
+        return self._copy(
+            where=self._where
+            + [
+                LocalPredicate(predicate)
+                if callable(predicate) and not isinstance(predicate, Expression)
+                else _check_type(
+                    predicate, (Predicate,), "used as a predicate, compare it instead"
+                )
+                for predicate in predicates
+            ]
+        )
+
+    def group_by(self, *columns: Union[str, Column]) -> Query:
+        """Group the rows by columns, to select aggregates with."""
+        return self._copy(
+            group_by=self._group_by
+            + [
+                _check_type(
+                    col(column) if isinstance(column, str) else column,
+                    (Column,),
+                    "grouped by",
+                )
+                for column in columns
+            ]
+        )
+
+    def order_by(self, *orderings: Union[str, Expression, Ordering]) -> Query:
+        """Order the rows, by column labels or by ``col(label).desc()``."""
+        built = [
+            ordering
+            if isinstance(ordering, Ordering)
+            else Ordering(col(ordering) if isinstance(ordering, str) else ordering)
+            for ordering in orderings
+        ]
+        for ordering in built:
+            _check_type(ordering.expression, (Column, Aggregate), "ordered by")
+        return self._copy(order_by=self._order_by + built)
+
+    def limit(self, limit: int) -> Query:
+        """Limit the number of rows."""
+        return self._copy(limit=limit)
+
+    def offset(self, offset: int) -> Query:
+        """Skip a number of rows."""
+        return self._copy(offset=offset)
+
+    def plan(self) -> QueryPlan:
+        """Split the query into the pushed down table query and local steps."""
+        column_label_id_map = self.worksheet.column_label_id_map
+        pushed_predicates, local_predicates = [], []
+        for predicate in self._where:
+            compiled = predicate.compile(column_label_id_map)
+            if compiled is None:
+                local_predicates.append(predicate)
+            else:
+                pushed_predicates.append(compiled)
+        aggregated = self._group_by or any(
+            isinstance(item, Aggregate) for item in self._select
+        )
+        local_projection = None
+        if local_predicates or any(isinstance(item, Computed) for item in self._select):
+            if aggregated:
+                raise InvalidQueryException(
+                    "Aggregated queries cannot be combined with locally evaluated "
+                    f"expressions: {', '.join(map(repr, local_predicates))}"
+                )
+            if self._select:
+                local_projection = self._select
+            # Rows are evaluated locally by label, so check the labels even when all
+            # the columns are downloaded
+            for expression in [*self._select, *local_predicates]:
+                for name in expression.columns or []:
+                    _column_id(name, column_label_id_map)
+            needed = _merge_columns([*self._select, *local_predicates])
+            select = (
+                []
+                if needed is None or not self._select
+                else [_column_id(name, column_label_id_map) for name in needed]
+            )
+            labels = []
+        else:
+            select = [
+                _compile_pushed(item, column_label_id_map) for item in self._select
+            ]
+            labels = [
+                f"{_compile_pushed(item, column_label_id_map)} "
+                f"{format_tq_literal(item._alias)}"
+                for item in self._select
+                if item._alias is not None
+            ]
+        clauses = [f"SELECT {', '.join(select) or '*'}"]
+        if pushed_predicates:
+            clauses.append(f"WHERE {' and '.join(pushed_predicates)}")
+        if self._group_by:
+            clauses.append(
+                "GROUP BY "
+                + ", ".join(
+                    _compile_pushed(column, column_label_id_map)
+                    for column in self._group_by
+                )
+            )
+        if self._order_by:
+            orderings = [
+                f"{_compile_pushed(ordering.expression, column_label_id_map)} "
+                f"{'DESC' if ordering.descending else 'ASC'}"
+                for ordering in self._order_by
+            ]
+            clauses.append(f"ORDER BY {', '.join(orderings)}")
+        local_offset = local_limit = None
+        if local_predicates:
+            local_offset, local_limit = self._offset, self._limit
+        else:
+            if self._limit is not None:
+                clauses.append(f"LIMIT {int(self._limit)}")
+            if self._offset:
+                clauses.append(f"OFFSET {int(self._offset)}")
+        if labels:
+            clauses.append(f"LABEL {', '.join(labels)}")
+        return QueryPlan(
+            " ".join(clauses),
+            local_predicates,
+            local_projection,
+            local_offset,
+            local_limit,
+        )
+
+    def explain(self) -> str:
+        """Describe what is pushed down to table query and what is done locally."""
+        return str(self.plan())
+
+    def query(
+        self, row_type: Any[Dict, List, Tuple] = None
+    ) -> Generator[Any[Dict, List, Tuple], None, None]:
+        """Execute the query."""
+        plan = self.plan()
+        result = self.worksheet._execute(plan.tq)
+        labels = [col["label"] for col in result["cols"]]
+        types = [col["type"] for col in result["cols"]]
+        rows: Iterator[dict] = (
+            {
+                label: convert_tq_value(get_cell_value(cell), tq_type)
+                for label, cell, tq_type in zip(labels, row["c"], types)
+            }
+            for row in result["rows"]
+        )
+        if plan.local_predicates:
+            rows = (
+                row
+                for row in rows
+                if all(predicate.evaluate(row) for predicate in plan.local_predicates)
+            )
+        if plan.local_offset or plan.local_limit is not None:
+            stop = None
+            if plan.local_limit is not None:
+                stop = (plan.local_offset or 0) + plan.local_limit
+            rows = itertools.islice(rows, plan.local_offset or 0, stop)
+        projection = plan.local_projection
+        if projection is not None:
+            rows = (
+                {item.label: item.evaluate(row) for item in projection} for row in rows
+            )
+        if row_type is None:
+            row_type = self.worksheet.default_row_type
+        if issubclass(row_type, dict):
+            return (row_type(row) for row in rows)
+        return (row_type(row.values()) for row in rows)
+
+    def __iter__(self) -> Iterator[Any[Dict, List, Tuple]]:
+        """Iterate over the results of the query."""
+        return iter(self.query())
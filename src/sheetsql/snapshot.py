@@ -0,0 +1,365 @@
+"""Memory-mapped columnar snapshots of table query results.
+
+A snapshot file starts with a magic number and the length of a JSON header holding
+the schema from the table query ``cols``. Then come the columns, each 8-byte
+aligned: a validity byte per row, followed by fixed-width float64 values for number
+columns, a byte per row for boolean columns, int64 values for date, datetime and
+timeofday columns, or, for string columns, uint64 offsets into a pool of UTF-8
+encoded strings.
+
+Dates are stored as days since 1970-01-01, datetimes as milliseconds since
+1970-01-01 00:00:00, and times of day as milliseconds since midnight.
+"""
+
+import datetime
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Sequence
+from typing import Any, Dict, Iterator, List, Optional
+
+from .exceptions import InvalidSnapshotException
+from .utils import convert_tq_value, get_cell_value, tq_column_names
+
+MAGIC = b"SHEETSQL"
+VERSION = 2
+HEADER_LENGTH = struct.Struct("<Q")
+ALIGNMENT = 8
+
+EPOCH = datetime.datetime(1970, 1, 1)
+MILLISECOND = datetime.timedelta(milliseconds=1)
+
+
+def _to_int64(value: Any, tq_type: str) -> int:
+    """Convert a date, datetime or time to the int64 value it is stored as."""
+    if tq_type == "date":
+        return (value - EPOCH.date()).days
+    if tq_type == "datetime":
+        return (value - EPOCH) // MILLISECOND
+    return (
+        (value.hour * 60 + value.minute) * 60 + value.second
+    ) * 1000 + value.microsecond // 1000
+
+
+def _from_int64(value: int, tq_type: str) -> Any:
+    """Convert a stored int64 value back to a date, datetime or time."""
+    if tq_type == "date":
+        return EPOCH.date() + datetime.timedelta(days=value)
+    if tq_type == "datetime":
+        return EPOCH + value * MILLISECOND
+    seconds, millisecond = divmod(value, 1000)
+    minutes, second = divmod(seconds, 60)
+    hour, minute = divmod(minutes, 60)
+    return datetime.time(hour, minute, second, millisecond * 1000)
+
+
+def _column_kind(tq_type: str) -> str:
+    """Get how a column of a given table query type is stored."""
+    if tq_type == "number":
+        return "float64"
+    if tq_type == "boolean":
+        return "bool"
+    if tq_type in ("date", "datetime", "timeofday"):
+        return "int64"
+    return "string"
+
+
+class _ColumnBuilder:
+    """Accumulate the values of a column in its storage format."""
+
+    def __init__(self, tq_type: str) -> None:
+        """Init method for the _ColumnBuilder class."""
+        self.tq_type = tq_type
+        self.kind = _column_kind(tq_type)
+        self.validity = bytearray()
+        self.data: array
+        if self.kind == "float64":
+            self.data = array("d")
+        elif self.kind == "bool":
+            self.data = array("B")
+        elif self.kind == "int64":
+            self.data = array("q")
+        else:
+            self.offsets = array("Q", [0])
+            self.pool = bytearray()
+
+    def append(self, value: Any) -> None:
+        """Append a value converted from a table query cell."""
+        self.validity.append(value is not None)
+        if self.kind == "float64":
+            self.data.append(float("nan") if value is None else value)
+        elif self.kind == "bool":
+            self.data.append(bool(value))
+        elif self.kind == "int64":
+            self.data.append(0 if value is None else _to_int64(value, self.tq_type))
+        else:
+            if value is not None:
+                self.pool += str(value).encode("utf-8")
+            self.offsets.append(len(self.pool))
+
+    def sections(self) -> Dict[str, bytes]:
+        """Get the binary sections of the column."""
+        if self.kind == "string":
+            return {
+                "validity": bytes(self.validity),
+                "offsets": self.offsets.tobytes(),
+                "pool": bytes(self.pool),
+            }
+        return {"validity": bytes(self.validity), "data": self.data.tobytes()}
+
+
+def _padding(length: int) -> bytes:
+    """Get the padding aligning a section of a given length."""
+    return b"\0" * (-length % ALIGNMENT)
+
+
+def write_snapshot(table: dict, path: str) -> int:
+    """Write a table query response to a snapshot file.
+
+    The file is written next to ``path``, flushed to disk and then moved in place, so
+    processes that have the previous snapshot mapped keep reading a consistent file.
+    Columns are labeled by ``tq_column_names``, so labels are unique.
+
+    Args:
+        table (dict): The table query response table, with ``cols`` and ``rows`` keys
+        path (str): Path of the snapshot file
+
+    Returns:
+        int: The number of rows written
+    """
+    types = [col["type"] for col in table["cols"]]
+    builders = [_ColumnBuilder(tq_type) for tq_type in types]
+    num_rows = 0
+    for row in table["rows"]:
+        for builder, cell, tq_type in zip(builders, row["c"], types):
+            builder.append(convert_tq_value(get_cell_value(cell), tq_type))
+        num_rows += 1
+
+    columns = []
+    sections = []
+    offset = 0
+    labels = tq_column_names(table["cols"])
+    for label, col, builder in zip(labels, table["cols"], builders):
+        column = {
+            "label": label,
+            "type": col["type"],
+            "kind": builder.kind,
+        }
+        for name, section in builder.sections().items():
+            column[name] = [offset, len(section)]
+            sections.append(section + _padding(len(section)))
+            offset += len(sections[-1])
+        columns.append(column)
+    header = json.dumps(
+        {
+            "version": VERSION,
+            "byteorder": sys.byteorder,
+            "num_rows": num_rows,
+            "columns": columns,
+        }
+    ).encode("utf-8")
+    header += b" " * (-(len(MAGIC) + HEADER_LENGTH.size + len(header)) % ALIGNMENT)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(HEADER_LENGTH.pack(len(header)))
+            f.write(header)
+            for section in sections:
+                f.write(section)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return num_rows
+
+
+class SnapshotColumn(Sequence):
+    """Column of a snapshot, reading values straight from the mapped file.
+
+    For all but string columns, ``values`` is a zero-copy memoryview of the float64,
+    byte or int64 values as stored, in which blank cells hold NaN or 0. Check
+    ``validity``, which holds 1 for non-blank values, to tell them apart.
+    """
+
+    _formats = {"float64": "d", "bool": "B", "int64": "q"}
+
+    def __init__(self, spec: dict, buffer: memoryview, num_rows: int) -> None:
+        """Init method for the SnapshotColumn class."""
+        self.label = spec["label"]
+        self.type = spec["type"]
+        self.kind = spec["kind"]
+        self._num_rows = num_rows
+        self._views: List[memoryview] = []
+
+        def section(name: str, format: str = "B") -> memoryview:
+            start, length = spec[name]
+            if start + length > len(buffer):
+                raise InvalidSnapshotException(
+                    f"The {name} of column {self.label!r} is truncated"
+                )
+            view = buffer[start : start + length].cast(format)  # type: ignore
+            self._views.append(view)
+            return view
+
+        try:
+            self.validity = section("validity")
+            if len(self.validity) != num_rows:
+                raise InvalidSnapshotException(
+                    f"Column {self.label!r} does not have {num_rows} rows"
+                )
+            self.values: Optional[memoryview] = None
+            if self.kind == "string":
+                self._offsets = section("offsets", "Q")
+                self._pool = section("pool")
+            else:
+                self._data = section("data", self._formats[self.kind])
+                self.values = self._data
+        except Exception:
+            self._release()
+            raise
+
+    def __repr__(self) -> str:
+        """Represent the column by its label and type."""
+        return f"<SnapshotColumn {self.label!r} type:{self.type}>"
+
+    def __len__(self) -> int:
+        """Get number of values."""
+        return self._num_rows
+
+    def __getitem__(self, i: Any) -> Any:
+        """Get the value of the column in a row, None for blank cells."""
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._num_rows))]
+        if i < 0:
+            i += self._num_rows
+        if not self.validity[i]:
+            return None
+        if self.kind == "float64":
+            return self._data[i]
+        if self.kind == "bool":
+            return bool(self._data[i])
+        if self.kind == "int64":
+            return _from_int64(self._data[i], self.type)
+        return str(self._pool[self._offsets[i] : self._offsets[i + 1]], "utf-8")
+
+    def _release(self) -> None:
+        """Release the views of the mapped file."""
+        for view in self._views:
+            view.release()
+
+
+class Snapshot:
+    """Read-only, memory-mapped snapshot of a worksheet.
+
+    Every process mapping the same snapshot shares one copy of it in the page cache,
+    and values are only decoded when accessed.
+
+    Args:
+        path (str): Path of the snapshot file, written by ``Worksheet.snapshot``
+    """
+
+    def __init__(self, path: str) -> None:
+        """Init method for the Snapshot class."""
+        self.path = path
+        self._num_rows = 0
+        self._columns: Dict[str, SnapshotColumn] = {}
+        with open(path, "rb") as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:
+                raise InvalidSnapshotException(
+                    f"{path} is empty, not a sheetsql snapshot"
+                ) from e
+        self._buffer = memoryview(self._mmap)
+        try:
+            self._read()
+        except Exception as e:
+            self.close()
+            if isinstance(e, InvalidSnapshotException):
+                raise
+            raise InvalidSnapshotException(
+                f"{path} is not a valid sheetsql snapshot: {e}"
+            ) from e
+
+    def _read(self) -> None:
+        """Read the header and map the columns."""
+        prefix_length = len(MAGIC) + HEADER_LENGTH.size
+        if self._buffer[: len(MAGIC)] != MAGIC:
+            raise InvalidSnapshotException(f"{self.path} is not a sheetsql snapshot")
+        (header_length,) = HEADER_LENGTH.unpack(
+            self._buffer[len(MAGIC) : prefix_length]
+        )
+        header = json.loads(
+            bytes(self._buffer[prefix_length : prefix_length + header_length])
+        )
+        if header["version"] != VERSION or header["byteorder"] != sys.byteorder:
+            raise InvalidSnapshotException(
+                f"{self.path} is a version {header['version']}, "
+                f"{header['byteorder']} endian snapshot, which cannot be read by this "
+                f"version of sheetsql on a {sys.byteorder} endian machine"
+            )
+        self._num_rows = header["num_rows"]
+        data = self._buffer[prefix_length + header_length :]
+        try:
+            for spec in header["columns"]:
+                if spec["label"] in self._columns:
+                    raise InvalidSnapshotException(
+                        f"{self.path} has several columns labeled {spec['label']!r}"
+                    )
+                self._columns[spec["label"]] = SnapshotColumn(
+                    spec, data, self._num_rows
+                )
+        finally:
+            data.release()
+
+    def __repr__(self) -> str:
+        """Represent the snapshot by its path."""
+        return f"<Snapshot {self.path!r} rows:{self._num_rows}>"
+
+    @property
+    def labels(self) -> List[str]:
+        """Get the labels of the columns."""
+        return list(self._columns.keys())
+
+    def column(self, label: str) -> SnapshotColumn:
+        """Get a column by its label."""
+        return self._columns[label]
+
+    def __getitem__(self, label: str) -> SnapshotColumn:
+        """Make columns subscriptable."""
+        return self.column(label)
+
+    def row(self, i: int) -> dict:
+        """Get a row as a dictionary of column label to value."""
+        return {label: column[i] for label, column in self._columns.items()}
+
+    def __iter__(self) -> Iterator[dict]:
+        """Iterate over the rows."""
+        return (self.row(i) for i in range(self._num_rows))
+
+    def __len__(self) -> int:
+        """Get number of rows."""
+        return self._num_rows
+
+    def close(self) -> None:
+        """Unmap the snapshot file. Columns cannot be used once it is closed."""
+        for column in self._columns.values():
+            column._release()
+        self._buffer.release()
+        self._mmap.close()
+
+    def __enter__(self) -> "Snapshot":
+        """Use the snapshot as a context manager."""
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        """Close the snapshot when leaving the context."""
+        self.close()
@@ -1,10 +1,16 @@
 """Spreadsheet interface."""
 
+import time
+from typing import Optional, Tuple, Union
+
 from gspread import Client
 from gspread import Spreadsheet as GSpreadSpreadsheet
+from gspread.urls import DRIVE_FILES_API_V3_URL
 
 from .worksheet import Worksheet  # type: ignore
 
+REVISION_MAX_AGE = 10.0
+
 
 class Spreadsheet(GSpreadSpreadsheet):
     """Class inheriting the gspread.Spreadsheet class to represent a spreadsheet."""
@@ -12,12 +18,69 @@ class Spreadsheet(GSpreadSpreadsheet):
     def __init__(self, client: Client, properties: dict) -> None:
         """Init method for the Spreadsheet class."""
         super().__init__(client, properties)
+        self._worksheets: dict = {}
+        self._revision_cache: Optional[Tuple[float, int]] = None
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Refetch the spreadsheet metadata and update the worksheet indexes.
+
+        Worksheets that still exist keep their Worksheet instance, with refreshed
+        properties, so references to them stay valid across refreshes.
+        """
         spreadsheet_metadata = self.fetch_sheet_metadata()
-        self._worksheets = {
-            worksheet["properties"]["title"]: Worksheet(self, worksheet["properties"])
-            for worksheet in spreadsheet_metadata["sheets"]
+        self._revision_cache = None
+        self._properties.update(spreadsheet_metadata["properties"])
+        existing = {worksheet.id: worksheet for worksheet in self._worksheets.values()}
+        worksheets = {}
+        for worksheet_metadata in spreadsheet_metadata["sheets"]:
+            properties = worksheet_metadata["properties"]
+            worksheet = existing.get(properties["sheetId"])
+            if worksheet is None:
+                worksheet = Worksheet(self, properties)
+            else:
+                worksheet._properties = properties
+            worksheets[properties["title"]] = worksheet
+        self._worksheets = worksheets
+        self._build_indexes()
+
+    def _build_indexes(self) -> None:
+        """Index the worksheets by gid and by position."""
+        self._worksheets_by_gid = {
+            worksheet.id: worksheet for worksheet in self._worksheets.values()
+        }
+        self._worksheets_by_index = {
+            worksheet._properties["index"]: worksheet
+            for worksheet in self._worksheets.values()
         }
 
+    def fetch_revision(self) -> int:
+        """Fetch the current revision of the spreadsheet, which increases on any change.
+
+        Each call sends a request to the Drive API.
+        """
+        response = self.client.request(
+            "get",
+            f"{DRIVE_FILES_API_V3_URL}/{self.id}",
+            params={"fields": "version", "supportsAllDrives": True},
+        )
+        revision = int(response.json()["version"])
+        self._revision_cache = (time.monotonic(), revision)
+        return revision
+
+    def cached_revision(self, max_age: float = REVISION_MAX_AGE) -> int:
+        """Get the revision of the spreadsheet, fetched at most every max_age seconds.
+
+        The revision is fetched again after ``refresh``, so changes made in the last
+        ``max_age`` seconds may not be seen until then.
+        """
+        if (
+            self._revision_cache is None
+            or time.monotonic() - self._revision_cache[0] >= max_age
+        ):
+            return self.fetch_revision()
+        return self._revision_cache[1]
+
     def __len__(self) -> int:
         """Return number of worksheets."""
         return len(self._worksheets)
@@ -34,3 +97,14 @@ class Spreadsheet(GSpreadSpreadsheet):
     def get_worksheet(self, worksheet_name: str) -> Worksheet:
         """Get specific worksheet by name."""
         return self._worksheets[worksheet_name]
+
+    def get_worksheet_by_gid(self, gid: Union[int, str]) -> Worksheet:
+        """Get specific worksheet by its gid, as found in worksheet URLs.
+
+        The gid can be passed as a string, as it is read from a URL.
+        """
+        return self._worksheets_by_gid[int(gid)]
+
+    def get_worksheet_by_index(self, index: int) -> Worksheet:
+        """Get specific worksheet by its zero-based position in the spreadsheet."""
+        return self._worksheets_by_index[index]
@@ -1,6 +1,12 @@
 """Utility functions."""
 
+import codecs
+import datetime
 import json
+import math
+from collections import Counter
+from decimal import Decimal
+from typing import Any, Iterator, List, Optional
 
 import regex
 from requests import Response
@@ -9,6 +15,11 @@ from .exceptions import InvalidQueryException
 
 EXTRACT_JSON_REGEX = regex.compile(r"\{(?:[^{}]|(?R))*\}")
 TQ_BASE_URL = "https://spreadsheets.google.com/tq"
+TQ_DATE_REGEX = regex.compile(r"^Date\((\d+(?:,\d+)*)\)$")
+TQ_STREAM_CHUNK_SIZE = 64 * 1024
+JSON_STRUCTURE_REGEX = regex.compile(r'["\[\]{}]')
+JSON_STRING_END_REGEX = regex.compile(r'["\\]')
+JSON_SCALAR_END_REGEX = regex.compile(r"[\s,\]}]")
 
 
 def parse_json_from_tq_response(response_text: str) -> dict:
@@ -41,3 +52,366 @@ def handle_tq_response(response: Response) -> dict:
             f"Response went through but received invalid query {response_json}"
         )
     return response_json["table"]
+
+
+class _JSONValueScanner:
+    """Find where a JSON string, array or object ends, across several chunks.
+
+    The scanner keeps its state between calls, so each chunk is only scanned once.
+    """
+
+    def __init__(self) -> None:
+        """Init method for the _JSONValueScanner class."""
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def scan(self, text: str) -> int:
+        """Scan the next chunk of the value, returning where it ends or -1."""
+        pos = 0
+        while True:
+            if self._escaped:
+                if pos == len(text):
+                    return -1
+                pos += 1
+                self._escaped = False
+            pattern = JSON_STRING_END_REGEX if self._in_string else JSON_STRUCTURE_REGEX
+            match = pattern.search(text, pos)
+            if match is None:
+                return -1
+            pos = match.end()
+            char = match.group()
+            if char == "\\":
+                self._escaped = True
+                continue
+            if char == '"':
+                self._in_string = not self._in_string
+                if self._in_string:
+                    continue
+            elif char in "[{":
+                self._depth += 1
+                continue
+            else:
+                self._depth -= 1
+            if self._depth == 0:
+                return pos
+
+
+class _JSONStreamReader:
+    """Decode JSON values one at a time from an iterator of text chunks."""
+
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, chunks: Iterator[str]) -> None:
+        """Init method for the _JSONStreamReader class."""
+        self._chunks = chunks
+        self._buffer = ""
+        self._pos = 0
+
+    def _next_chunk(self) -> Optional[str]:
+        """Get the next non-empty chunk, or None once exhausted."""
+        for chunk in self._chunks:
+            if chunk:
+                return chunk
+        return None
+
+    def _fill(self) -> bool:
+        """Read the next chunk into the buffer, returning False once exhausted."""
+        chunk = self._next_chunk()
+        if chunk is None:
+            return False
+        self._buffer = self._buffer[self._pos :] + chunk
+        self._pos = 0
+        return True
+
+    def _read_value(self) -> None:
+        """Read chunks until the string, array or object at the position is complete.
+
+        The chunks are scanned as they arrive and only joined once, so a value
+        spanning many chunks is read in linear time.
+        """
+        scanner = _JSONValueScanner()
+        chunks = [self._buffer[self._pos :]]
+        while scanner.scan(chunks[-1]) == -1:
+            chunk = self._next_chunk()
+            if chunk is None:
+                raise self._incomplete()
+            chunks.append(chunk)
+        self._buffer = "".join(chunks)
+        self._pos = 0
+
+    def _incomplete(self) -> ValueError:
+        """Build the exception raised when the response ends mid-value."""
+        return ValueError("Table query response ended unexpectedly")
+
+    def seek(self, char: str) -> None:
+        """Skip ahead to the first occurrence of char, leaving it unconsumed."""
+        while True:
+            index = self._buffer.find(char, self._pos)
+            if index != -1:
+                self._pos = index
+                return
+            self._pos = len(self._buffer)
+            if not self._fill():
+                raise self._incomplete()
+
+    def next_char(self) -> str:
+        """Consume and return the next non-whitespace character."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos].isspace():
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                self._pos += 1
+                return self._buffer[self._pos - 1]
+            if not self._fill():
+                raise self._incomplete()
+
+    def peek_char(self) -> str:
+        """Return the next non-whitespace character without consuming it."""
+        char = self.next_char()
+        self._pos -= 1
+        return char
+
+    def expect(self, expected: str) -> None:
+        """Consume the next non-whitespace character, which must be expected."""
+        char = self.next_char()
+        if char != expected:
+            raise ValueError(
+                f"Expected {expected!r} in table query response, got {char!r}"
+            )
+
+    def decode(self) -> Any:
+        """Decode the next complete JSON value."""
+        if self.peek_char() in '"[{':
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                # Read the rest of the value at once rather than decoding it again
+                # from the start after every chunk
+                self._read_value()
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        else:
+            # A number or literal at the end of the buffer may continue in the next
+            # chunk, so read until the character following it
+            while (
+                JSON_SCALAR_END_REGEX.search(self._buffer, self._pos) is None
+                and self._fill()
+            ):
+                pass
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        self._pos = end
+        return value
+
+    def iter_object(self) -> Iterator[str]:
+        """Iterate over the keys of an object, the caller decoding each value."""
+        self.expect("{")
+        if self.peek_char() == "}":
+            self.next_char()
+            return
+        while True:
+            key = self.decode()
+            self.expect(":")
+            yield key
+            char = self.next_char()
+            if char == "}":
+                return
+            if char != ",":
+                raise ValueError(
+                    f"Expected ',' or '}}' in table query response, got {char!r}"
+                )
+
+    def iter_array(self) -> Iterator[None]:
+        """Iterate over the elements of an array, the caller decoding each element."""
+        self.expect("[")
+        if self.peek_char() == "]":
+            self.next_char()
+            return
+        while True:
+            yield None
+            char = self.next_char()
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError(
+                    f"Expected ',' or ']' in table query response, got {char!r}"
+                )
+
+
+def _iter_response_text(response: Response) -> Iterator[str]:
+    """Incrementally decode the body of a streamed response to text."""
+    decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(
+        errors="replace"
+    )
+    for chunk in response.iter_content(chunk_size=TQ_STREAM_CHUNK_SIZE):
+        yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
+
+def stream_tq_response(response: Response) -> dict:
+    """Handle a streamed response returned from the table query.
+
+    The response body is decoded incrementally: the columns are parsed up front and
+    each row is decoded from the body only when the returned ``rows`` iterator
+    reaches it, so the full response is never held in memory.
+
+    Args:
+        response (Response): Table query response, requested with ``stream=True``
+
+    Raises:
+        InvalidQueryException: if the specified query is invalid
+
+    Returns:
+        dict: The table key of the response JSON, with ``rows`` as an iterator
+    """
+    reader = _JSONStreamReader(_iter_response_text(response))
+    response_json: dict = {}
+    try:
+        reader.seek("{")
+        for key in reader.iter_object():
+            # Successful responses have an "ok" or "warning" status
+            if key != "table" or response_json.get("status") == "error":
+                response_json[key] = reader.decode()
+                continue
+            table: dict = {}
+            for table_key in reader.iter_object():
+                if table_key == "rows" and "cols" in table:
+                    table["rows"] = _iter_tq_rows(reader, response)
+                    return table
+                table[table_key] = reader.decode()
+            response_json["table"] = table
+    except ValueError:
+        response.close()
+        raise
+    response.close()
+    if response_json.get("status") == "error":
+        raise InvalidQueryException(
+            f"Response went through but received invalid query {response_json}"
+        )
+    table = response_json["table"]
+    table["rows"] = iter(table["rows"])
+    return table
+
+
+def _iter_tq_rows(reader: _JSONStreamReader, response: Response) -> Iterator[dict]:
+    """Decode the rows of a table query response one at a time."""
+    try:
+        for _ in reader.iter_array():
+            yield reader.decode()
+    finally:
+        response.close()
+
+
+def tq_column_names(cols: list) -> List[str]:
+    """Get unique names for the columns of a table query response.
+
+    Columns are named by their label, or by their ID if they have none. Labels are
+    not unique in a worksheet, so columns sharing a label are suffixed with their
+    ID, e.g. ``total_B`` and ``total_D``.
+
+    Args:
+        cols (list): The ``cols`` key of the table query response
+
+    Returns:
+        List[str]: The name of each column
+    """
+    names = [col["label"] or col["id"] for col in cols]
+    counts = Counter(names)
+    return [
+        f"{name}_{col['id']}" if counts[name] > 1 else name
+        for name, col in zip(names, cols)
+    ]
+
+
+def get_cell_value(cell: Optional[dict]) -> Any:
+    """Get the raw value of a table query cell.
+
+    Args:
+        cell (Optional[dict]): The table query cell, ``None`` for blank cells
+
+    Returns:
+        Any: The value of the cell, or ``None`` if the cell is blank
+    """
+    if cell is None:
+        return None
+    return cell.get("v")
+
+
+def convert_tq_value(value: Any, tq_type: str) -> Any:
+    """Convert a raw table query value to the Python type matching its column type.
+
+    Args:
+        value (Any): The raw table query value
+        tq_type (str): The table query column type (e.g. ``number`` or ``date``)
+
+    Returns:
+        Any: ``datetime.date``, ``datetime.datetime`` and ``datetime.time`` objects
+        for date, datetime and timeofday columns, the raw value otherwise
+    """
+    if value is None:
+        return None
+    if tq_type in ("date", "datetime"):
+        match = TQ_DATE_REGEX.match(value)
+        if match is None:
+            return value
+        parts = [int(part) for part in match.group(1).split(",")]
+        year, month, day, hour, minute, second, millisecond = parts + [0] * (
+            7 - len(parts)
+        )
+        # Months are zero-indexed in table query date literals
+        if tq_type == "date":
+            return datetime.date(year, month + 1, day)
+        return datetime.datetime(
+            year, month + 1, day, hour, minute, second, millisecond * 1000
+        )
+    if tq_type == "timeofday":
+        hour, minute, second, *millisecond = value
+        return datetime.time(
+            hour, minute, second, millisecond[0] * 1000 if millisecond else 0
+        )
+    return value
+
+
+def format_tq_literal(value: Any) -> str:
+    """Format a Python value as a table query literal.
+
+    Args:
+        value (Any): A string, number, boolean, date, or naive datetime or time
+
+    Raises:
+        InvalidQueryException: if the value cannot be expressed as a literal
+
+    Returns:
+        str: The table query literal
+    """
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        if not math.isfinite(value):
+            raise InvalidQueryException(f"{value} cannot be used in a table query")
+        return format(Decimal(repr(value)), "f")
+    if isinstance(value, (datetime.datetime, datetime.time)) and value.tzinfo:
+        # Table query datetimes have no time zone, they are in the spreadsheet's
+        raise InvalidQueryException(
+            f"{value!r} is timezone-aware and cannot be used in a table query. "
+            "Convert it to a naive value in the time zone of the spreadsheet"
+        )
+    if isinstance(value, datetime.datetime):
+        return f"datetime '{value.isoformat(sep=' ', timespec='milliseconds')}'"
+    if isinstance(value, datetime.date):
+        return f"date '{value.isoformat()}'"
+    if isinstance(value, datetime.time):
+        return f"timeofday '{value.isoformat(timespec='milliseconds')}'"
+    if isinstance(value, str):
+        # The table query language has no escape sequences, so the string can only
+        # be quoted with a quote character it does not contain
+        if '"' not in value:
+            return f'"{value}"'
+        if "'" not in value:
+            return f"'{value}'"
+        raise InvalidQueryException(
+            f"{value!r} contains both single and double quotes and cannot be "
+            "used in a table query"
+        )
+    raise InvalidQueryException(
+        f"{value!r} of type {type(value).__name__} cannot be used in a table query"
+    )
@@ -4,7 +4,7 @@ from __future__ import annotations
 
 import re
 import string
-from typing import Any, Dict, Generator, List, Tuple
+from typing import Any, Dict, Generator, Iterable, List, Optional, Tuple, Union
 
 import requests
 from gspread import Worksheet as GSpreadWorksheet
@@ -12,7 +12,17 @@ from gspread import Worksheet as GSpreadWorksheet
 from sheetsql import spreadsheet
 
 from .exceptions import InvalidRowTypeException
-from .utils import TQ_BASE_URL, handle_tq_response
+from .export import (
+    DEFAULT_CHUNK_SIZE,
+    ResumableExport,
+    check_export_format,
+    write_table,
+)
+from .index import WorksheetIndex
+from .pool import PooledClient
+from .query import Expression, PreparedQuery, Query
+from .snapshot import write_snapshot
+from .utils import TQ_BASE_URL, convert_tq_value, get_cell_value, stream_tq_response
 
 
 class Worksheet(GSpreadWorksheet):
@@ -22,6 +32,8 @@ class Worksheet(GSpreadWorksheet):
         """Init method for Worksheet class."""
         super().__init__(spreadsheet, properties)
         self._default_row_type = dict
+        self._schema_cache: Optional[Tuple[int, list]] = None
+        self._count_cache: Optional[Tuple[int, int]] = None
 
     @property
     def columns(self) -> list:
@@ -58,26 +70,130 @@ class Worksheet(GSpreadWorksheet):
         See https://developers.google.com/chart/interactive/docs/querylanguage
         for more info
         """
+        result = self._execute(self._update_tq_cols(tq))
+        return self._result_handler(result, row_type=row_type)
+
+    def select(self, *columns: Union[str, Expression]) -> Query:
+        """Build a query on the worksheet, selecting columns or aggregates.
+
+        The query is compiled to table query where possible, e.g.
+        ``worksheet.select("name").where(col("total") > 100).order_by("name")``.
+        Call ``select()`` without columns to select all of them.
+        """
+        return Query(self).select(*columns)
+
+    def prepare(self, tq: str) -> PreparedQuery:
+        """Prepare a table query with ``:name`` parameter placeholders.
+
+        The column labels are rewritten once, and the returned query can then be
+        executed many times with different parameter values, e.g.
+        ``worksheet.prepare("SELECT name WHERE total > :min").query(min=100)``.
+        """
+        return PreparedQuery(self, tq)
+
+    def build_index(
+        self,
+        key_column: str,
+        sorted_columns: Optional[Iterable[str]] = None,
+        refresh_interval: Optional[float] = None,
+    ) -> WorksheetIndex:
+        """Load the worksheet into an in-memory index keyed by a column.
+
+        Use the index for local ``get``, ``get_many`` and ``range`` lookups instead
+        of sending a query per lookup.
+        """
+        return WorksheetIndex(
+            self,
+            key_column,
+            sorted_columns=sorted_columns,
+            refresh_interval=refresh_interval,
+        )
+
+    def export(
+        self,
+        path: str,
+        format: str = "parquet",
+        tq: str = "SELECT *",
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        compression: Optional[str] = None,
+    ) -> int:
+        """Export the results of a query to a Parquet or Arrow IPC file.
+
+        Record batches are built straight from the table query response and written
+        in chunks of ``chunk_size`` rows. Pass ``tq`` to export a filtered or
+        projected subset of the worksheet. Requires the optional pyarrow dependency.
+        """
+        check_export_format(format)
+        result = self._execute(self._update_tq_cols(tq))
+        return write_table(
+            result, path, format=format, chunk_size=chunk_size, compression=compression
+        )
+
+    def resumable_export(
+        self,
+        directory: str,
+        format: str = "parquet",
+        tq: str = "SELECT *",
+        page_size: int = DEFAULT_CHUNK_SIZE,
+        compression: Optional[str] = None,
+    ) -> ResumableExport:
+        """Create an export to part files that can resume after failures.
+
+        Call ``run`` on the returned export, and call it again after a failure to
+        continue from the last checkpoint instead of starting over.
+        """
+        return ResumableExport(
+            self,
+            directory,
+            format=format,
+            tq=tq,
+            page_size=page_size,
+            compression=compression,
+        )
+
+    def snapshot(self, path: str, tq: str = "SELECT *") -> int:
+        """Write the results of a query to a memory-mappable snapshot file.
+
+        Open the file with ``sheetsql.snapshot.Snapshot`` to read it without the
+        network, sharing a single page-cached copy across processes.
+        """
+        result = self._execute(self._update_tq_cols(tq))
+        return write_snapshot(result, path)
+
+    def _execute(self, tq: str) -> dict:
+        """Send a table query, whose columns are already rewritten, to Google Sheets.
+
+        The response is streamed, so rows are decoded as the result is iterated.
+        Spreadsheets opened through a connection with several credentials send the
+        query with one of the pooled credentials.
+        """
         params = {
             "key": self.spreadsheet.id,
-            "tq": self._update_tq_cols(tq),
+            "tq": tq,
             "gid": self.id,
         }
-        response = requests.get(TQ_BASE_URL, params=params)
-        result = handle_tq_response(response)
-        return self._result_handler(result, row_type=row_type)
+        client = self.spreadsheet.client
+        if isinstance(client, PooledClient):
+            response = client.tq_request(params)
+        else:
+            response = requests.get(TQ_BASE_URL, params=params, stream=True)
+        return stream_tq_response(response)
 
     @property
     def column_label_id_map(self) -> dict:
         """Get dictionary contaning a map of column label to column identifier."""
         return {col: string.ascii_uppercase[i] for i, col in enumerate(self.columns)}
 
-    def _update_tq_cols(self, tq: str) -> str:
+    def _update_tq_cols(
+        self, tq: str, column_label_id_map: Optional[dict] = None
+    ) -> str:
         """Replace column label with column identifier.
 
         This is needed for Google Sheet's table query syntax.
         """
-        for k, v in self.column_label_id_map.items():
+        if column_label_id_map is None:
+            column_label_id_map = self.column_label_id_map
+        for k, v in column_label_id_map.items():
             tq = re.sub(rf"\b{k}\b", v, tq)
         return tq
 
@@ -102,10 +218,75 @@ class Worksheet(GSpreadWorksheet):
         """Get generator that contains all rows in the spreadsheet."""
         return self.query("SELECT *")
 
+    def _schema(self, revision: int) -> list:
+        """Get the table query columns of the worksheet, cached per revision."""
+        if self._schema_cache is None or self._schema_cache[0] != revision:
+            self._schema_cache = (revision, self._execute("SELECT * LIMIT 0")["cols"])
+        return self._schema_cache[1]
+
+    def describe(
+        self, columns: Optional[Iterable[str]] = None, count_rows: bool = False
+    ) -> Dict[str, dict]:
+        """Profile columns of the worksheet with a single aggregate table query.
+
+        For each column, get its type, the number of non-blank values, and their min
+        and max, along with their sum and avg for number columns. The column types
+        come from a ``SELECT * LIMIT 0`` query, cached until the spreadsheet revision
+        changes, so a warm ``describe`` sends only the aggregate query.
+
+        Table query aggregates skip blank values, so they cannot count rows. Pass
+        ``count_rows=True`` to add the number of rows from ``count``, which
+        downloads the first column of the worksheet.
+        """
+        schema = self._schema(self.spreadsheet.cached_revision())
+        if not schema:
+            return {}
+        cols_by_label = {col["label"]: col for col in schema}
+        described = [
+            cols_by_label[label] for label in (columns or cols_by_label.keys())
+        ]
+        aggregates = []
+        for col in described:
+            functions = ["count", "min", "max"]
+            if col["type"] == "number":
+                functions += ["sum", "avg"]
+            aggregates += [f"{function}({col['id']})" for function in functions]
+        result = self._execute(f"SELECT {', '.join(aggregates)}")
+        values = [
+            convert_tq_value(get_cell_value(cell), col["type"])
+            for cell, col in zip(next(iter(result["rows"]))["c"], result["cols"])
+        ]
+        position = 0
+        summaries = {}
+        for col in described:
+            summary = {
+                "type": col["type"],
+                "count_non_null": int(values[position]),
+                "min": values[position + 1],
+                "max": values[position + 2],
+            }
+            position += 3
+            if col["type"] == "number":
+                summary["sum"], summary["avg"] = values[position : position + 2]
+                position += 2
+            if count_rows:
+                summary["count"] = self.count()
+            summaries[col["label"]] = summary
+        return summaries
+
     def count(self) -> int:
-        """Get number of rows."""
-        count = [row for row in self.query("SELECT COUNT(A)", row_type=list)][0]
-        return count
+        """Get number of rows, cached until the spreadsheet revision changes.
+
+        Table query does not count blank values, so the rows are counted by
+        streaming the first column: each call after a change downloads a response
+        proportional to the number of rows. The revision is checked with
+        ``Spreadsheet.cached_revision``, so at most once every few seconds.
+        """
+        revision = self.spreadsheet.cached_revision()
+        if self._count_cache is None or self._count_cache[0] != revision:
+            result = self._execute("SELECT A")
+            self._count_cache = (revision, sum(1 for _ in result["rows"]))
+        return self._count_cache[1]
 
     def __len__(self) -> int:
         """Make the worksheet callable with the len function."""
@@ -5,19 +5,25 @@ import pytest
 from .mocks import MockGoogleSheetsConnection, MockSpreadsheet, MockWorksheet
 
 spreadsheet_1_worksheets_data = {
-    "worksheet_1": MockWorksheet(),
-    "worksheet_2": MockWorksheet(),
+    "worksheet_1": MockWorksheet({"sheetId": 0, "index": 0, "title": "worksheet_1"}),
+    "worksheet_2": MockWorksheet({"sheetId": 123, "index": 1, "title": "worksheet_2"}),
 }
 
 spreadsheet_2_worksheets_data = {
-    "worksheet_1": MockWorksheet(),
-    "worksheet_2": MockWorksheet(),
-    "worksheet_3": MockWorksheet(),
+    "worksheet_1": MockWorksheet({"sheetId": 0, "index": 0, "title": "worksheet_1"}),
+    "worksheet_2": MockWorksheet({"sheetId": 456, "index": 1, "title": "worksheet_2"}),
+    "worksheet_3": MockWorksheet({"sheetId": 789, "index": 2, "title": "worksheet_3"}),
 }
 
 spreadsheets_data = {
-    "spreadsheet_1": MockSpreadsheet(worksheets=spreadsheet_1_worksheets_data),
-    "spreadsheet_2": MockSpreadsheet(worksheets=spreadsheet_2_worksheets_data),
+    "spreadsheet_1": MockSpreadsheet(
+        worksheets=spreadsheet_1_worksheets_data,
+        properties={"id": "spreadsheet_1", "title": "Sales"},
+    ),
+    "spreadsheet_2": MockSpreadsheet(
+        worksheets=spreadsheet_2_worksheets_data,
+        properties={"id": "spreadsheet_2", "title": "Inventory"},
+    ),
 }
 
 
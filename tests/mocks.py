@@ -1,7 +1,14 @@
 """Mocks for testing the sheetsql package."""
 
+import re
+from typing import Any, Callable, Dict, Optional
+
+import gspread
+import mock
+
 from sheetsql.connection import GoogleSheetsConnection
 from sheetsql.spreadsheet import Spreadsheet
+from sheetsql.utils import parse_json_from_tq_response
 from sheetsql.worksheet import Worksheet
 
 
@@ -12,11 +19,17 @@ class MockGoogleSheetsConnection(GoogleSheetsConnection):
         spreadsheets (dict): test spreadsheets data
     """
 
-    __slots__ = ("_spreadsheets",)
+    __slots__ = ("_spreadsheets", "_spreadsheet_ids_by_title")
 
     def __init__(self, spreadsheets: dict) -> None:
         """Init method for MockGoogleSheetsConnection."""
         self._spreadsheets = spreadsheets
+        self._build_indexes(
+            [
+                {"id": spreadsheet_id, "name": spreadsheet.title}
+                for spreadsheet_id, spreadsheet in spreadsheets.items()
+            ]
+        )
 
 
 class MockSpreadsheet(Spreadsheet):
@@ -24,20 +37,141 @@ class MockSpreadsheet(Spreadsheet):
 
     Args:
         worksheets (dict): test worksheets data
+        properties (dict): test spreadsheet properties
     """
 
-    __slots__ = ("_worksheets",)
+    __slots__ = ("_worksheets", "_properties", "_revision_cache")
 
-    def __init__(self, worksheets: dict) -> None:
+    def __init__(self, worksheets: dict, properties: Optional[dict] = None) -> None:
         """Init method for MockSpreadsheet."""
         self._worksheets = worksheets
+        self._properties = properties or {}
+        self._revision_cache = None
+        self._build_indexes()
 
 
 class MockWorksheet(Worksheet):
-    """Mock Worksheet class."""
+    """Mock Worksheet class.
 
-    __slots__ = ("_default_row_type",)
+    Args:
+        properties (dict): test worksheet properties
+    """
 
-    def __init__(self) -> None:
+    __slots__ = ("_default_row_type", "_properties", "_schema_cache", "_count_cache")
+
+    def __init__(self, properties: Optional[dict] = None) -> None:
         """Init method for MockWorksheet."""
         self._default_row_type = dict
+        self._schema_cache = None
+        self._count_cache = None
+        self._properties = properties or {"sheetId": 0, "index": 0}
+
+
+def mock_tq_response(response_path: str) -> mock.MagicMock:
+    """Mock a table query response with the contents of a sample response file."""
+    response = mock.MagicMock()
+    with open(response_path) as f:
+        text = f.read()
+    type(response).text = mock.PropertyMock(return_value=text)
+    type(response).status_code = mock.PropertyMock(return_value=200)
+    type(response).encoding = mock.PropertyMock(return_value="utf-8")
+    content = text.encode("utf-8")
+    # Small chunks make rows and values straddle chunk boundaries
+    response.iter_content.side_effect = lambda chunk_size: (
+        content[i : i + 7] for i in range(0, len(content), 7)
+    )
+    return response
+
+
+class MockSession:
+    """Mock HTTP session standing in for the authorized session of a credential.
+
+    Args:
+        handler (Callable): returns the status code and JSON body for a request URL
+    """
+
+    def __init__(self, handler: Callable[[str], tuple]) -> None:
+        """Init method for MockSession."""
+        self.handler = handler
+        self.calls: list = []
+
+    def get(self, url: str, params: Optional[dict] = None, **kwargs: Any) -> mock.Mock:
+        """Send a mock GET request."""
+        self.calls.append(url)
+        status_code, body = self.handler(url)
+        response = mock.MagicMock(status_code=status_code, ok=status_code < 400)
+        response.json.return_value = body
+        response.headers = {}
+        return response
+
+
+def mock_client(spreadsheet_ids: list, throttled: bool = False) -> gspread.Client:
+    """Create a gspread client with a mock session that can access some spreadsheets."""
+
+    def handler(url: str) -> tuple:
+        if url.endswith("/files"):
+            return 200, {"files": [{"id": i, "name": i} for i in spreadsheet_ids]}
+        if throttled:
+            return 429, {}
+        return 200, {"sheets": [], "properties": {"title": "title"}}
+
+    return gspread.Client(None, session=MockSession(handler))
+
+
+def typed_table() -> dict:
+    """Get the table of the typed sample response."""
+    with open("tests/sample_response/typed_query_response.txt") as f:
+        return parse_json_from_tq_response(f.read())["table"]
+
+
+def paged_execute(table: dict, fail_at_offset: Optional[int] = None) -> Callable:
+    """Mock Worksheet._execute, paging the table with the LIMIT and OFFSET clauses."""
+
+    def execute(tq: str) -> dict:
+        match = re.search(r"LIMIT (\d+) OFFSET (\d+)", tq)
+        assert match is not None
+        limit, offset = int(match.group(1)), int(match.group(2))
+        if offset == fail_at_offset and limit:
+            raise TimeoutError
+        return {"cols": table["cols"], "rows": iter(table["rows"][offset:][:limit])}
+
+    return execute
+
+
+def aggregate_execute(table: dict) -> Callable:
+    """Mock Worksheet._execute, answering schema, first column and aggregate queries."""
+
+    def execute(tq: str) -> dict:
+        if tq == "SELECT * LIMIT 0":
+            return {"cols": table["cols"], "rows": iter([])}
+        if tq == "SELECT A":
+            return {
+                "cols": table["cols"][:1],
+                "rows": iter({"c": row["c"][:1]} for row in table["rows"]),
+            }
+        types = {col["id"]: col["type"] for col in table["cols"]}
+        positions = {col["id"]: i for i, col in enumerate(table["cols"])}
+        cols, cells = [], []
+        for function, col_id in re.findall(r"(\w+)\((\w+)\)", tq):
+            values = [
+                row["c"][positions[col_id]]["v"]
+                for row in table["rows"]
+                if row["c"][positions[col_id]] is not None
+            ]
+            functions: Dict[str, Callable[[list], Any]] = {
+                "count": len,
+                "min": min,
+                "max": max,
+                "sum": sum,
+                "avg": lambda v: sum(v) / len(v),
+            }
+            value = functions[function](values)
+            cols.append(
+                {"id": f"{function}-{col_id}", "label": "", "type": types[col_id]}
+            )
+            if function == "count":
+                cols[-1]["type"] = "number"
+            cells.append({"v": value})
+        return {"cols": cols, "rows": iter([{"c": cells}])}
+
+    return execute
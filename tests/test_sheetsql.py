@@ -1,16 +1,47 @@
 """sheetsql package tests."""
 
+import datetime
+import itertools
+import time
 from collections import OrderedDict
+from pathlib import Path
 
 import mock
 import pytest
 from gspread.exceptions import GSpreadException
+from gspread.urls import SPREADSHEETS_API_V4_BASE_URL
 
-from sheetsql import connect
-from sheetsql.exceptions import InvalidQueryException
-from sheetsql.utils import handle_tq_response, parse_json_from_tq_response
+from sheetsql import col, connect
+from sheetsql.exceptions import (
+    DuplicateSpreadsheetException,
+    InconsistentExportException,
+    InvalidExportFormatException,
+    InvalidQueryException,
+    InvalidSnapshotException,
+    QuotaExceededException,
+    SpreadsheetNotFoundException,
+)
+from sheetsql.pool import ClientPool, PooledClient
+from sheetsql.snapshot import Snapshot
+from sheetsql.utils import (
+    _JSONStreamReader,
+    convert_tq_value,
+    format_tq_literal,
+    handle_tq_response,
+    parse_json_from_tq_response,
+    stream_tq_response,
+)
 
-from .mocks import MockGoogleSheetsConnection, MockWorksheet
+from .mocks import (
+    MockGoogleSheetsConnection,
+    MockSpreadsheet,
+    MockWorksheet,
+    aggregate_execute,
+    mock_client,
+    mock_tq_response,
+    paged_execute,
+    typed_table,
+)
 
 
 class TestUtils:
@@ -58,6 +89,96 @@ class TestUtils:
         with pytest.raises(InvalidQueryException):
             handle_tq_response(response)
 
+    def test_stream_tq_response(self) -> None:
+        """It decodes the columns up front and the rows lazily."""
+        response = mock_tq_response("tests/sample_response/typed_query_response.txt")
+        with open("tests/sample_response/typed_query_response.txt") as f:
+            expected = parse_json_from_tq_response(f.read())["table"]
+        table = stream_tq_response(response)
+        assert table["cols"] == expected["cols"]
+        response.close.assert_not_called()
+        assert next(table["rows"]) == expected["rows"][0]
+        assert list(table["rows"]) == expected["rows"][1:]
+        response.close.assert_called_once()
+
+    def test_json_stream_reader(self) -> None:
+        """It decodes values split at any point across chunks."""
+        reader = _JSONStreamReader(
+            iter(["-25", "00.", '5 {"a', '\\"": ["]', '"', ", 1e", "3]}"])
+        )
+        assert reader.decode() == -2500.5
+        assert reader.decode() == {'a"': ["]", 1000.0]}
+
+    def test_stream_warning_tq_response(self, tmp_path: Path) -> None:
+        """It streams the rows of responses with warnings."""
+        with open("tests/sample_response/typed_query_response.txt") as f:
+            text = f.read()
+        path = tmp_path / "warning_query_response.txt"
+        path.write_text(
+            text.replace(
+                '"status":"ok"',
+                '"status":"warning","warnings":[{"reason":"data_truncated"}]',
+            )
+        )
+        response = mock_tq_response(str(path))
+        table = stream_tq_response(response)
+        response.close.assert_not_called()
+        assert list(table["rows"]) == parse_json_from_tq_response(text)["table"]["rows"]
+        response.close.assert_called_once()
+
+    def test_stream_truncated_tq_response(self, tmp_path: Path) -> None:
+        """It closes the response when it cannot be decoded."""
+        with open("tests/sample_response/typed_query_response.txt") as f:
+            text = f.read()
+        path = tmp_path / "truncated_query_response.txt"
+        path.write_text(text[: text.index('"rows"') - 20])
+        response = mock_tq_response(str(path))
+        with pytest.raises(ValueError):
+            stream_tq_response(response)
+        response.close.assert_called_once()
+
+    def test_stream_invalid_tq_response(self) -> None:
+        """It raises an exception for an invalid streamed table query response."""
+        response = mock_tq_response("tests/sample_response/invalid_query_response.txt")
+        with pytest.raises(InvalidQueryException):
+            stream_tq_response(response)
+
+    def test_convert_tq_value(self) -> None:
+        """It converts table query values to the Python type of the column."""
+        assert convert_tq_value(1.5, "number") == 1.5
+        assert convert_tq_value(None, "date") is None
+        assert convert_tq_value("Date(2020,0,15)", "date") == datetime.date(2020, 1, 15)
+        assert convert_tq_value(
+            "Date(2020,11,31,23,59,30)", "datetime"
+        ) == datetime.datetime(2020, 12, 31, 23, 59, 30)
+        assert convert_tq_value([9, 30, 0, 250], "timeofday") == datetime.time(
+            9, 30, 0, 250000
+        )
+
+    def test_format_tq_literal(self) -> None:
+        """It formats Python values as typed, quoted table query literals."""
+        assert format_tq_literal(True) == "true"
+        assert format_tq_literal(42) == "42"
+        assert format_tq_literal(1e-05) == "0.00001"
+        assert format_tq_literal("it's") == '"it\'s"'
+        assert format_tq_literal('say "hi"') == "'say \"hi\"'"
+        assert format_tq_literal(datetime.date(2020, 1, 15)) == "date '2020-01-15'"
+        assert (
+            format_tq_literal(datetime.datetime(2020, 1, 15, 9, 30))
+            == "datetime '2020-01-15 09:30:00.000'"
+        )
+        assert format_tq_literal(datetime.time(9, 30)) == "timeofday '09:30:00.000'"
+        with pytest.raises(InvalidQueryException):
+            format_tq_literal('it\'s "both"')
+        with pytest.raises(InvalidQueryException):
+            format_tq_literal(float("nan"))
+        with pytest.raises(InvalidQueryException):
+            format_tq_literal(None)
+        with pytest.raises(InvalidQueryException):
+            format_tq_literal(
+                datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+            )
+
 
 class TestGoogleSheetsConnection:
     """GoogleSpreadSheetsConnection class tests."""
@@ -100,6 +221,66 @@ class TestGoogleSheetsConnection:
         """It returns the number of spreadsheets."""
         assert len(conn) == len(spreadsheets) == 2
 
+    def test_get_spreadsheet_by_title(
+        self, conn: MockGoogleSheetsConnection, spreadsheets: dict
+    ) -> None:
+        """It returns the spreadsheets with a given title."""
+        assert conn.get_spreadsheet_by_title("Sales") == spreadsheets["spreadsheet_1"]
+        assert conn.find_spreadsheets("Inventory") == [spreadsheets["spreadsheet_2"]]
+        assert conn.find_spreadsheets("Missing") == []
+        with pytest.raises(SpreadsheetNotFoundException):
+            conn.get_spreadsheet_by_title("Missing")
+        duplicates = {
+            spreadsheet_id: MockSpreadsheet(
+                worksheets={}, properties={"title": "Sales"}
+            )
+            for spreadsheet_id in ("a", "b")
+        }
+        conn = MockGoogleSheetsConnection(spreadsheets=duplicates)
+        assert conn.find_spreadsheets("Sales") == list(duplicates.values())
+        with pytest.raises(DuplicateSpreadsheetException):
+            conn.get_spreadsheet_by_title("Sales")
+
+    def test_get_by_url(
+        self,
+        conn: MockGoogleSheetsConnection,
+        spreadsheets: dict,
+        spreadsheet_2_worksheets: dict,
+    ) -> None:
+        """It returns the spreadsheet and worksheet referenced by a URL."""
+        url = "https://docs.google.com/spreadsheets/d/spreadsheet_2/edit"
+        assert conn.get_spreadsheet_by_url(url) == spreadsheets["spreadsheet_2"]
+        assert (
+            conn.get_worksheet_by_url(f"{url}#gid=456")
+            == spreadsheet_2_worksheets["worksheet_2"]
+        )
+        assert (
+            conn.get_worksheet_by_url(f"{url}?gid=789#gid=789")
+            == spreadsheet_2_worksheets["worksheet_3"]
+        )
+        assert conn.get_worksheet_by_url(url) == spreadsheet_2_worksheets["worksheet_1"]
+        with pytest.raises(KeyError):
+            conn.get_worksheet_by_url(f"{url}#gid=123")
+
+    @mock.patch("src.sheetsql.connection.gspread.service_account")
+    def test_refresh(self, mock_service_account: mock.Mock) -> None:
+        """It relists the spreadsheets, keeping and retitling existing ones."""
+        client = mock_client(["a", "b"])
+        mock_service_account.return_value = client
+        conn = connect("service_account")
+        spreadsheet = conn["a"]
+        with mock.patch.object(
+            client,
+            "list_spreadsheet_files",
+            return_value=[{"id": "a", "name": "renamed"}, {"id": "c", "name": "c"}],
+        ):
+            conn.refresh()
+        assert [s.id for s in conn.spreadsheets] == ["a", "c"]
+        assert conn["a"] is spreadsheet
+        assert spreadsheet.title == "renamed"
+        assert conn.get_spreadsheet_by_title("renamed") is spreadsheet
+        assert conn.find_spreadsheets("a") == []
+
     def test_conn_invalid_auth_type(self) -> None:
         """It raises an exception for invalid auth types."""
         with pytest.raises(GSpreadException):
@@ -202,6 +383,64 @@ class TestSpreadsheet:
         assert len(conn["spreadsheet_1"]) == len(spreadsheet_1_worksheets) == 2
         assert len(conn["spreadsheet_2"]) == len(spreadsheet_2_worksheets) == 3
 
+    def test_get_worksheet_by_gid_and_index(
+        self, conn: MockGoogleSheetsConnection, spreadsheet_2_worksheets: dict
+    ) -> None:
+        """It returns the worksheet with a given gid or position."""
+        spreadsheet = conn["spreadsheet_2"]
+        assert (
+            spreadsheet.get_worksheet_by_gid(456)
+            == spreadsheet.get_worksheet_by_gid("456")
+            == spreadsheet.get_worksheet_by_index(1)
+            == spreadsheet_2_worksheets["worksheet_2"]
+        )
+        with pytest.raises(KeyError):
+            spreadsheet.get_worksheet_by_gid(123)
+        with pytest.raises(KeyError):
+            spreadsheet.get_worksheet_by_index(3)
+
+    def test_refresh(self) -> None:
+        """It updates the worksheet indexes from refreshed metadata."""
+        worksheet = MockWorksheet({"sheetId": 1, "index": 0, "title": "old"})
+        spreadsheet = MockSpreadsheet(worksheets={"old": worksheet})
+        spreadsheet.client = mock.Mock()
+        metadata = {
+            "properties": {"title": "Renamed"},
+            "sheets": [
+                {"properties": {"sheetId": 2, "index": 0, "title": "added"}},
+                {"properties": {"sheetId": 1, "index": 1, "title": "renamed"}},
+            ],
+        }
+        with mock.patch.object(
+            MockSpreadsheet, "fetch_sheet_metadata", return_value=metadata
+        ):
+            spreadsheet.refresh()
+        assert spreadsheet.title == "Renamed"
+        assert spreadsheet.worksheets == ["added", "renamed"]
+        assert spreadsheet["renamed"] is worksheet
+        assert spreadsheet.get_worksheet_by_index(1) is worksheet
+        assert spreadsheet.get_worksheet_by_gid(2).title == "added"
+
+    def test_revision(self) -> None:
+        """It fetches the spreadsheet revision from Drive, caching it for a while."""
+        spreadsheet = MockSpreadsheet(worksheets={}, properties={"id": "abc"})
+        spreadsheet.client = mock.Mock()
+        spreadsheet.client.request.return_value.json.return_value = {"version": "42"}
+        assert spreadsheet.fetch_revision() == 42
+        assert spreadsheet.client.request.call_args[0][1].endswith("/files/abc")
+        spreadsheet.client.request.return_value.json.return_value = {"version": "43"}
+        assert spreadsheet.cached_revision() == 42
+        assert spreadsheet.cached_revision(max_age=0) == 43
+        assert spreadsheet.client.request.call_count == 2
+        with mock.patch.object(
+            MockSpreadsheet,
+            "fetch_sheet_metadata",
+            return_value={"properties": {}, "sheets": []},
+        ):
+            spreadsheet.refresh()
+        spreadsheet.client.request.return_value.json.return_value = {"version": "44"}
+        assert spreadsheet.cached_revision() == 44
+
 
 class TestWorksheet:
     """Worksheet class tests."""
@@ -245,13 +484,11 @@ class TestWorksheet:
     @mock.patch("requests.get")
     def test_query(self, mock_request_get: mock.Mock, worksheet: MockWorksheet) -> None:
         """It queries the worksheet and returns results."""
-        response = mock.MagicMock()
         worksheet.spreadsheet = mock.Mock()
         worksheet._properties = {"sheetId": "patched"}
-        with open("tests/sample_response/valid_query_response.txt") as f:
-            type(response).text = mock.PropertyMock(return_value=f.read())
-        type(response).status_code = mock.PropertyMock(return_value=200)
-        mock_request_get.return_value = response
+        mock_request_get.side_effect = lambda *args, **kwargs: mock_tq_response(
+            "tests/sample_response/valid_query_response.txt"
+        )
         res = [row for row in worksheet.query("SELECT SUM(test), SUM(test3)")]
         assert res == [{"sum test": 15.0, "sum test2": 40.0}]
         mock_request_get.assert_called_once()
@@ -268,3 +505,575 @@ class TestWorksheet:
         print(res)
         assert res == [OrderedDict([("sum test", 15.0), ("sum test2", 40.0)])]
         assert mock_request_get.call_count == 4
+
+    def test_describe(self, worksheet: MockWorksheet) -> None:
+        """It profiles columns in one aggregate query once the schema is cached."""
+        worksheet.spreadsheet = mock.Mock(**{"cached_revision.return_value": 1})
+        with mock.patch.object(
+            MockWorksheet, "_execute", side_effect=aggregate_execute(typed_table())
+        ) as mock_execute:
+            summary = worksheet.describe(["total", "created"])
+            assert summary == {
+                "total": {
+                    "type": "number",
+                    "count_non_null": 2,
+                    "min": -3.0,
+                    "max": 12.5,
+                    "sum": 9.5,
+                    "avg": 4.75,
+                },
+                "created": {
+                    "type": "date",
+                    "count_non_null": 2,
+                    "min": datetime.date(2020, 1, 15),
+                    "max": datetime.date(2021, 6, 1),
+                },
+            }
+            assert [c[0][0] for c in mock_execute.call_args_list] == [
+                "SELECT * LIMIT 0",
+                "SELECT count(B), min(B), max(B), sum(B), avg(B), count(D), min(D), "
+                "max(D)",
+            ]
+            assert set(worksheet.describe()) == {
+                "name",
+                "total",
+                "active",
+                "created",
+                "updated",
+                "opens",
+            }
+            assert mock_execute.call_count == 3
+            summary = worksheet.describe(["created"], count_rows=True)
+            assert summary["created"]["count"] == 3
+            assert [c[0][0] for c in mock_execute.call_args_list[3:]] == [
+                "SELECT count(D), min(D), max(D)",
+                "SELECT A",
+            ]
+
+    def test_count(self, worksheet: MockWorksheet) -> None:
+        """It counts rows with blank values, cached until the revision changes."""
+        table = typed_table()
+        table["cols"] = table["cols"][:2]
+        table["rows"] = [
+            {"c": [None, {"v": 1.0}]},
+            {"c": [{"v": "a"}, None]},
+            {"c": [{"v": "b"}, {"v": 2.0}]},
+        ]
+        worksheet.spreadsheet = mock.Mock(**{"cached_revision.return_value": 1})
+        with mock.patch.object(
+            MockWorksheet, "_execute", side_effect=aggregate_execute(table)
+        ) as mock_execute:
+            assert len(worksheet) == worksheet.count() == 3
+            mock_execute.assert_called_once_with("SELECT A")
+            worksheet.spreadsheet.cached_revision.return_value = 2
+            assert len(worksheet) == 3
+            assert mock_execute.call_count == 2
+
+
+class TestExport:
+    """Worksheet export tests."""
+
+    @pytest.mark.parametrize("format", ["parquet", "arrow"])
+    @mock.patch("requests.get")
+    def test_export(
+        self,
+        mock_request_get: mock.Mock,
+        format: str,
+        worksheet: MockWorksheet,
+        tmp_path: Path,
+    ) -> None:
+        """It writes typed record batches in chunks to Parquet and Arrow IPC files."""
+        pa = pytest.importorskip("pyarrow")
+        worksheet.spreadsheet = mock.Mock()
+        worksheet._properties = {"sheetId": "patched"}
+        mock_request_get.return_value = mock_tq_response(
+            "tests/sample_response/typed_query_response.txt"
+        )
+        path = str(tmp_path / f"export.{format}")
+        with mock.patch.object(MockWorksheet, "_update_tq_cols", side_effect=str):
+            assert worksheet.export(path, format=format, chunk_size=2) == 3
+        if format == "parquet":
+            import pyarrow.parquet as pq
+
+            table = pq.read_table(path)
+            assert pq.ParquetFile(path).num_row_groups == 2
+        else:
+            reader = pa.ipc.open_file(path)
+            table = reader.read_all()
+            assert reader.num_record_batches == 2
+        assert table.schema.types == [
+            pa.string(),
+            pa.float64(),
+            pa.bool_(),
+            pa.date32(),
+            pa.timestamp("ms"),
+            pa.time32("ms"),
+        ]
+        assert table.column("total").to_pylist() == [12.5, None, -3.0]
+        assert table.column("created").to_pylist() == [
+            datetime.date(2020, 1, 15),
+            None,
+            datetime.date(2021, 6, 1),
+        ]
+
+    def test_export_duplicate_labels(
+        self, worksheet: MockWorksheet, tmp_path: Path
+    ) -> None:
+        """It suffixes columns sharing a label with their ID."""
+        pq = pytest.importorskip("pyarrow.parquet")
+        table = typed_table()
+        table["cols"][1]["label"] = table["cols"][0]["label"] = "x"
+        path = str(tmp_path / "export.parquet")
+        with mock.patch.object(
+            MockWorksheet, "_execute", return_value=table
+        ), mock.patch.object(MockWorksheet, "_update_tq_cols", side_effect=str):
+            worksheet.export(path)
+        assert pq.read_table(path).column_names[:2] == ["x_A", "x_B"]
+
+    def test_export_invalid_format(
+        self, worksheet: MockWorksheet, tmp_path: Path
+    ) -> None:
+        """It raises an exception for unsupported formats before querying."""
+        with mock.patch.object(MockWorksheet, "_execute") as mock_execute:
+            with pytest.raises(InvalidExportFormatException):
+                worksheet.export(str(tmp_path / "export.csv"), format="csv")
+        mock_execute.assert_not_called()
+
+    def test_export_failure(self, worksheet: MockWorksheet, tmp_path: Path) -> None:
+        """It leaves no partial file behind when the export fails."""
+        pytest.importorskip("pyarrow")
+        table = typed_table()
+        table["rows"] = iter([*table["rows"], {"c": [{"v": 1.5}]}])
+        with mock.patch.object(
+            MockWorksheet, "_execute", return_value=table
+        ), mock.patch.object(MockWorksheet, "_update_tq_cols", side_effect=str):
+            with pytest.raises(TypeError):
+                worksheet.export(str(tmp_path / "export.parquet"), chunk_size=2)
+        assert list(tmp_path.iterdir()) == []
+
+    def test_resumable_export(self, worksheet: MockWorksheet, tmp_path: Path) -> None:
+        """It resumes from the checkpoint unless the revision changed."""
+        pq = pytest.importorskip("pyarrow.parquet")
+        worksheet.spreadsheet = mock.Mock(**{"fetch_revision.return_value": 1})
+        directory = str(tmp_path / "export")
+        export = worksheet.resumable_export(
+            directory, tq="SELECT * LABEL A 'n'", page_size=2
+        )
+        with mock.patch.object(MockWorksheet, "_update_tq_cols", side_effect=str):
+            with mock.patch.object(
+                MockWorksheet, "_execute", side_effect=paged_execute(typed_table(), 2)
+            ):
+                with pytest.raises(TimeoutError):
+                    export.run()
+            checkpoint = export.load_checkpoint()
+            assert checkpoint is not None and checkpoint["offset"] == 2
+            assert len(export.part_paths) == 1
+            with mock.patch.object(
+                MockWorksheet, "_execute", side_effect=paged_execute(typed_table())
+            ) as mock_execute:
+                assert export.run() == 3
+            assert [c[0][0] for c in mock_execute.call_args_list] == [
+                "SELECT * LIMIT 0 OFFSET 0 LABEL A 'n'",
+                "SELECT * LIMIT 2 OFFSET 2 LABEL A 'n'",
+            ]
+            assert pq.read_table(export.part_paths).num_rows == 3
+            worksheet.spreadsheet.fetch_revision.return_value = 2
+            with mock.patch.object(
+                MockWorksheet, "_execute", side_effect=paged_execute(typed_table())
+            ) as mock_execute:
+                assert export.run() == 3
+            assert mock_execute.call_count == 3
+            checkpoint = export.load_checkpoint()
+            assert checkpoint is not None and checkpoint["revision"] == 2
+        with pytest.raises(InvalidQueryException):
+            worksheet.resumable_export(directory, tq="SELECT * LIMIT 5")
+
+    def test_resumable_export_restarts(
+        self, worksheet: MockWorksheet, tmp_path: Path
+    ) -> None:
+        """It starts over when the spreadsheet changes during the export."""
+        pq = pytest.importorskip("pyarrow.parquet")
+        worksheet._properties["title"] = "worksheet_1"
+        worksheet.spreadsheet = mock.Mock()
+        worksheet.spreadsheet.fetch_revision.side_effect = itertools.chain(
+            [1], itertools.repeat(2)
+        )
+        export = worksheet.resumable_export(str(tmp_path), page_size=2)
+        with mock.patch.object(
+            MockWorksheet, "_update_tq_cols", side_effect=str
+        ), mock.patch.object(
+            MockWorksheet, "_execute", side_effect=paged_execute(typed_table())
+        ) as mock_execute:
+            assert export.run() == 3
+            assert [c[0][0] for c in mock_execute.call_args_list] == [
+                "SELECT * LIMIT 0 OFFSET 0",
+                "SELECT * LIMIT 2 OFFSET 0",
+                "SELECT * LIMIT 2 OFFSET 0",
+                "SELECT * LIMIT 2 OFFSET 2",
+            ]
+            checkpoint = export.load_checkpoint()
+            assert checkpoint is not None and checkpoint["revision"] == 2
+            assert pq.read_table(export.part_paths).num_rows == 3
+            worksheet.spreadsheet.fetch_revision.side_effect = itertools.count(3)
+            with pytest.raises(InconsistentExportException):
+                export.run()
+
+
+class TestPreparedQuery:
+    """PreparedQuery class tests."""
+
+    @mock.patch("src.sheetsql.worksheet.GSpreadWorksheet.row_values")
+    def test_prepare(
+        self, mock_row_values: mock.Mock, worksheet: MockWorksheet
+    ) -> None:
+        """It rewrites the columns once and binds typed parameters."""
+        mock_row_values.return_value = ["name", "region", "total"]
+        prepared = worksheet.prepare(
+            "SELECT name  WHERE region = :region\n AND total > :min AND name != ':min'"
+        )
+        assert prepared.params == ("region", "min")
+        assert (
+            prepared.bind(region="it's west", min=100)
+            == "SELECT A WHERE B = \"it's west\" AND C > 100 AND A != ':min'"
+        )
+        prepared.bind(region="east", min=1.5)
+        mock_row_values.assert_called_once()
+        with pytest.raises(InvalidQueryException):
+            prepared.bind(region="east")
+        with pytest.raises(InvalidQueryException):
+            prepared.bind(region="east", min=1, max=2)
+
+    @mock.patch("src.sheetsql.worksheet.GSpreadWorksheet.row_values")
+    def test_cache_key(
+        self, mock_row_values: mock.Mock, worksheet: MockWorksheet
+    ) -> None:
+        """It normalizes equivalent queries to the same cache key."""
+        mock_row_values.return_value = ["name", "region", "total"]
+        worksheet.spreadsheet = mock.Mock(id="spreadsheet_1")
+        worksheet._properties = {"sheetId": 0}
+        key = worksheet.prepare("SELECT name WHERE total > :min").cache_key(min=1)
+        assert key == ("spreadsheet_1", 0, "SELECT A WHERE C > 1")
+        assert key == worksheet.prepare(" SELECT  A\tWHERE  total > :min ").cache_key(
+            min=1
+        )
+
+    @mock.patch("requests.get")
+    def test_query(self, mock_request_get: mock.Mock, worksheet: MockWorksheet) -> None:
+        """It executes the bound query."""
+        worksheet.spreadsheet = mock.Mock()
+        worksheet._properties = {"sheetId": "patched"}
+        mock_request_get.return_value = mock_tq_response(
+            "tests/sample_response/valid_query_response.txt"
+        )
+        with mock.patch.object(MockWorksheet, "column_label_id_map", {"test": "A"}):
+            prepared = worksheet.prepare("SELECT SUM(test) WHERE test > :min")
+        res = list(prepared.query(row_type=list, min=0))
+        assert res == [[15.0, 40.0]]
+        assert mock_request_get.call_args[1]["params"]["tq"] == (
+            "SELECT SUM(A) WHERE A > 0"
+        )
+
+
+class TestClientPool:
+    """ClientPool class tests."""
+
+    def test_routes_to_credentials_with_access(self) -> None:
+        """It only routes a spreadsheet to the credentials that can access it."""
+        clients = [mock_client(["a", "b"]), mock_client(["b"]), mock_client(["b"])]
+        pool = ClientPool(clients)
+        assert [f["id"] for f in pool.list_spreadsheet_files()] == ["a", "b"]
+        for _ in range(3):
+            pool.client_for("a").request("get", SPREADSHEETS_API_V4_BASE_URL)
+        assert [len(c.session.calls) for c in clients] == [4, 1, 1]
+        for _ in range(3):
+            pool.client_for("b").request("get", SPREADSHEETS_API_V4_BASE_URL)
+        assert [len(c.session.calls) for c in clients] == [5, 2, 2]
+        with pytest.raises(SpreadsheetNotFoundException):
+            pool.client_for("c").request("get", SPREADSHEETS_API_V4_BASE_URL)
+
+    def test_least_loaded(self) -> None:
+        """It routes requests to the credential with the least usage."""
+        pool = ClientPool([mock_client(["a"]), mock_client(["a"])], "least_loaded")
+        pool.list_spreadsheet_files()
+        pool.credentials[0].requests = 10
+        pool.client_for("a").request("get", SPREADSHEETS_API_V4_BASE_URL)
+        assert [c.requests for c in pool.credentials] == [10, 1]
+
+    def test_fails_over_on_rate_limit(self) -> None:
+        """It cools down rate limited credentials and fails over to the others."""
+        pool = ClientPool([mock_client(["a"], throttled=True), mock_client(["a"])])
+        pool.list_spreadsheet_files()
+        for _ in range(3):
+            pool.client_for("a").request("get", SPREADSHEETS_API_V4_BASE_URL)
+        throttled, healthy = pool.credentials
+        assert throttled.cooling_down and throttled.throttled == 1
+        assert healthy.requests == 3
+        healthy.cooldown_until = throttled.cooldown_until
+        with pytest.raises(QuotaExceededException):
+            pool.client_for("a").request("get", SPREADSHEETS_API_V4_BASE_URL)
+
+    @mock.patch("src.sheetsql.connection.gspread.service_account")
+    def test_connection_with_credentials(self, mock_service_account: mock.Mock) -> None:
+        """It opens each spreadsheet with a client routed across the credentials."""
+        mock_service_account.side_effect = [mock_client(["a"]), mock_client(["a", "b"])]
+        conn = connect("service_account", credentials=["one.json", "two.json"])
+        assert len(conn) == 2
+        assert isinstance(conn["a"].client, PooledClient)
+        assert mock_service_account.call_args_list == [
+            mock.call(filename="one.json"),
+            mock.call(filename="two.json"),
+        ]
+        with pytest.raises(GSpreadException):
+            connect("oauth", credentials=["one.json"])
+
+
+class TestWorksheetIndex:
+    """WorksheetIndex class tests."""
+
+    def test_lookups(self, worksheet: MockWorksheet) -> None:
+        """It serves point and range lookups from memory."""
+        worksheet.spreadsheet = mock.Mock(**{"fetch_revision.return_value": 1})
+        with mock.patch.object(
+            MockWorksheet, "_execute", return_value=typed_table()
+        ) as mock_execute:
+            index = worksheet.build_index("name", sorted_columns=["total", "created"])
+            assert index["gizmo"]["total"] == -3.0
+            assert index.get("missing") is None
+            assert [
+                row and row["total"]
+                for row in index.get_many(["gizmo", "x", "widget {a}"])
+            ] == [-3.0, None, 12.5]
+            assert [row["name"] for row in index.range(column="total")] == [
+                "gizmo",
+                "widget {a}",
+            ]
+            assert [row["name"] for row in index.range(0, 20, column="total")] == [
+                "widget {a}"
+            ]
+            assert [
+                row["name"]
+                for row in index.range(lo=datetime.date(2021, 1, 1), column="created")
+            ] == ["gizmo"]
+            assert [row["name"] for row in index.range("gadget", "gizmo")] == [
+                'gadget "b"',
+                "gizmo",
+            ]
+            mock_execute.assert_called_once_with("SELECT *")
+
+    def test_refresh(self, worksheet: MockWorksheet) -> None:
+        """It only reloads the worksheet when the revision changes."""
+        worksheet.spreadsheet = mock.Mock(**{"fetch_revision.return_value": 1})
+        with mock.patch.object(
+            MockWorksheet, "_execute", side_effect=lambda tq: typed_table()
+        ) as mock_execute:
+            index = worksheet.build_index("name")
+            assert not index.refresh()
+            worksheet.spreadsheet.fetch_revision.return_value = 2
+            assert index.refresh()
+            assert index.revision == 2
+            assert mock_execute.call_count == 2
+
+    def test_background_refresh(self, worksheet: MockWorksheet) -> None:
+        """It swaps in a reloaded index in the background."""
+        worksheet.spreadsheet = mock.Mock(**{"fetch_revision.return_value": 1})
+        with mock.patch.object(
+            MockWorksheet, "_execute", side_effect=lambda tq: typed_table()
+        ):
+            index = worksheet.build_index("name", refresh_interval=0.01)
+            worksheet.spreadsheet.fetch_revision.return_value = 2
+            for _ in range(100):
+                if index.revision == 2:
+                    break
+                time.sleep(0.01)
+            index.stop()
+        assert index.revision == 2
+        assert "gizmo" in index
+
+
+class TestQuery:
+    """Query builder tests."""
+
+    column_label_id_map = {
+        "name": "A",
+        "total": "B",
+        "active": "C",
+        "created": "D",
+        "updated": "E",
+        "opens": "F",
+    }
+
+    def test_pushdown(self, worksheet: MockWorksheet) -> None:
+        """It compiles expressible queries entirely to table query."""
+        with mock.patch.object(
+            MockWorksheet, "column_label_id_map", self.column_label_id_map
+        ):
+            query = (
+                worksheet.select("name", col("total").alias("amount"))
+                .where(col("total") > 100, col("name").isin(["a", "b"]))
+                .where(
+                    col("created") >= datetime.date(2020, 1, 1),
+                    col("opens").is_not_null(),
+                )
+                .order_by("name", col("total").desc())
+                .limit(50)
+            )
+            assert query.explain() == (
+                'tq: SELECT A, B WHERE B > 100 and (A = "a" or A = "b") and '
+                "D >= date '2020-01-01' and F is not null ORDER BY A ASC, B DESC "
+                'LIMIT 50 LABEL B "amount"\nlocal: none'
+            )
+            query = worksheet.select("active", col("total").sum()).group_by("active")
+            assert query.plan().tq == "SELECT C, sum(B) GROUP BY C"
+
+    def test_local_fallback(self, worksheet: MockWorksheet) -> None:
+        """It evaluates what table query cannot express locally."""
+        with mock.patch.object(
+            MockWorksheet, "column_label_id_map", self.column_label_id_map
+        ), mock.patch.object(
+            MockWorksheet, "_execute", return_value=typed_table()
+        ) as mock_execute:
+            query = (
+                worksheet.select("name", col("total").apply(abs).alias("abs_total"))
+                .where(col("total") != 0, lambda row: row["active"] is not None)
+                .where(col("name").like("g%") | (col("total") > 10))
+                .order_by("name")
+                .limit(1)
+                .offset(1)
+            )
+            assert query.explain() == (
+                'tq: SELECT * WHERE B != 0 and (A like "g%" or B > 10) '
+                "ORDER BY A ASC\n"
+                "local: filter <lambda>; offset 1; limit 1; project name, abs_total"
+            )
+            # The mock ignores the pushed down predicates, only local steps apply
+            assert list(query) == [{"name": 'gadget "b"', "abs_total": None}]
+            assert list(query.offset(0)) == [{"name": "widget {a}", "abs_total": 12.5}]
+            mock_execute.assert_called_with(query.plan().tq)
+            query = worksheet.select("name").where(col("name") == 'it\'s "both"')
+            assert query.explain() == (
+                "tq: SELECT A\nlocal: filter col('name') == 'it\\'s \"both\"'; "
+                "project name"
+            )
+            with pytest.raises(InvalidQueryException):
+                worksheet.select(col("total").sum()).where(lambda row: True).plan()
+
+    def test_invalid_queries(self, worksheet: MockWorksheet) -> None:
+        """It rejects expressions that would silently build a wrong query."""
+        with pytest.raises(TypeError):
+            worksheet.select().where((col("total") > 1) and (col("total") < 2))
+        with pytest.raises(TypeError):
+            worksheet.select().where(1 < col("total") < 5)
+        with mock.patch.object(
+            MockWorksheet, "column_label_id_map", self.column_label_id_map
+        ):
+            with pytest.raises(InvalidQueryException):
+                worksheet.select("B").where(lambda row: True).plan()
+            with pytest.raises(InvalidQueryException):
+                worksheet.select("name").where(col("B") > 1).plan()
+            with pytest.raises(InvalidQueryException):
+                worksheet.select().where(col("name"))  # type: ignore[arg-type]
+            with pytest.raises(InvalidQueryException):
+                worksheet.select(col("total") > 1)
+            with pytest.raises(InvalidQueryException):
+                worksheet.select().order_by(col("total").apply(abs))
+            with pytest.raises(InvalidQueryException):
+                worksheet.select().where(col("total") < None)
+            with pytest.raises(InvalidQueryException):
+                worksheet.select().where(col("total") > float("nan")).plan()
+            aware = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+            with pytest.raises(InvalidQueryException):
+                worksheet.select().where(col("updated") > aware).plan()
+            query = worksheet.select("name").where(
+                col("total") == None, col("opens") != None  # noqa: E711
+            )
+            assert query.plan().tq == "SELECT A WHERE B is null and F is not null"
+
+    def test_local_evaluation(self) -> None:
+        """It evaluates predicates locally like table query does."""
+        row = {"name": "widget", "total": None, "created": datetime.date(2020, 1, 1)}
+        assert (col("name").startswith("wid") & col("name").matches("w.*t")).evaluate(
+            row
+        )
+        assert not (col("total") > 1).evaluate(row)
+        assert (~(col("total") > 1)).evaluate(row)
+        assert col("total").is_null().evaluate(row)
+        assert (col("created") < datetime.date(2021, 1, 1)).evaluate(row)
+        assert not (col("name") > 1).evaluate(row)
+
+
+class TestSnapshot:
+    """Worksheet snapshot tests."""
+
+    def test_snapshot(self, worksheet: MockWorksheet, tmp_path: Path) -> None:
+        """It writes a snapshot that is read back through a memory map."""
+        path = str(tmp_path / "worksheet.snapshot")
+        with mock.patch.object(
+            MockWorksheet, "_execute", return_value=typed_table()
+        ), mock.patch.object(MockWorksheet, "_update_tq_cols", side_effect=str):
+            assert worksheet.snapshot(path) == 3
+        with Snapshot(path) as snapshot:
+            assert len(snapshot) == 3
+            assert snapshot.labels == [
+                "name",
+                "total",
+                "active",
+                "created",
+                "updated",
+                "opens",
+            ]
+            total = snapshot["total"]
+            assert total.values is not None
+            assert total.values.format == "d" and total.values.readonly
+            assert list(total) == [12.5, None, -3.0]
+            assert list(snapshot["active"]) == [True, False, None]
+            assert snapshot["name"][-1] == "gizmo"
+            assert snapshot["name"][:2] == ["widget {a}", 'gadget "b"']
+            assert list(snapshot)[0] == {
+                "name": "widget {a}",
+                "total": 12.5,
+                "active": True,
+                "created": datetime.date(2020, 1, 15),
+                "updated": datetime.datetime(2020, 12, 31, 23, 59, 30),
+                "opens": datetime.time(9, 30),
+            }
+            assert snapshot.row(1)["created"] is None
+            created = snapshot["created"]
+            assert created.values is not None
+            assert created.values.format == "q"
+            assert (
+                created.values[0]
+                == (datetime.date(2020, 1, 15) - datetime.date(1970, 1, 1)).days
+            )
+
+    def test_snapshot_duplicate_labels(self, tmp_path: Path) -> None:
+        """It suffixes columns sharing a label with their ID."""
+        path = str(tmp_path / "worksheet.snapshot")
+        table = typed_table()
+        table["cols"][1]["label"] = table["cols"][0]["label"] = "x"
+        with mock.patch.object(
+            MockWorksheet, "_execute", return_value=table
+        ), mock.patch.object(MockWorksheet, "_update_tq_cols", side_effect=str):
+            MockWorksheet().snapshot(path)
+        with Snapshot(path) as snapshot:
+            assert snapshot.labels[:2] == ["x_A", "x_B"]
+            assert list(snapshot["x_B"]) == [12.5, None, -3.0]
+
+    def test_invalid_snapshot(self, tmp_path: Path) -> None:
+        """It refuses to read files that are not snapshots."""
+        path = tmp_path / "not.snapshot"
+        with mock.patch.object(
+            MockWorksheet, "_execute", return_value=typed_table()
+        ), mock.patch.object(MockWorksheet, "_update_tq_cols", side_effect=str):
+            MockWorksheet().snapshot(str(path))
+        valid = path.read_bytes()
+        for contents in [
+            b"not a snapshot",
+            b"",
+            valid[:12],
+            valid[:20] + b"{" + valid[21:],
+            valid[:-8],
+            valid.replace(b'"total"', b'"name" ', 1),
+        ]:
+            path.write_bytes(contents)
+            with pytest.raises(InvalidSnapshotException):
+                Snapshot(str(path))